@@ -1,8 +1,29 @@
 from flask import Flask, jsonify
-from views import PostView, UserView
+from views import PostView, PostBulkView, PostRestoreView, PostSearchView, PostChangesView, UserView, TokenView
 from errors import ApiException
+from json_provider import FastJSONProvider
+from db import engine, pool_stats, replica_pool
+from auth import credential_cache
+import metrics
+import ratelimit
+import routing
 
 app = Flask('app')
+app.json = FastJSONProvider(app)
+metrics.init_app(app)
+ratelimit.init_app(app)
+routing.init_app(app)
+metrics.instrument_engine(engine)
+for replica in replica_pool.engines:
+    metrics.instrument_engine(replica)
+metrics.GaugeFunction('db_pool_checked_out', 'Connections in use', lambda: engine.pool.checkedout())
+metrics.GaugeFunction('db_pool_overflow', 'Connections over pool_size', lambda: engine.pool.overflow())
+metrics.GaugeFunction('db_pool_max_wait_seconds', 'Longest wait for a connection', lambda: pool_stats.max_wait)
+metrics.CounterFunction('credential_cache_hits_total', 'Credential cache hits',
+                        lambda: credential_cache.stats()['hits'])
+metrics.CounterFunction('credential_cache_misses_total', 'Credential cache misses',
+                        lambda: credential_cache.stats()['misses'])
+metrics.GaugeFunction('credential_cache_size', 'Cached credentials', lambda: credential_cache.stats()['size'])
 
 
 @app.errorhandler(ApiException)
@@ -12,6 +33,7 @@ def error_handler(error: ApiException):
         'message': error.message
     })
     response.status_code = error.status_code
+    response.headers.update(error.headers)
     return response
 
 
@@ -21,9 +43,23 @@ def index():
     return jsonify({'check': 'Ok'})
 
 
+@app.route('/pool-stats')
+def pool_stats_view():
+    return jsonify(pool_stats.as_dict())
+
+
 app.add_url_rule('/posts/', view_func=PostView.as_view('posts'), methods=['GET', 'POST'])
 app.add_url_rule('/posts/<int:post_id>', view_func=PostView.as_view('post_detail'), methods=['GET', 'PATCH', 'DELETE'])
+app.add_url_rule('/posts/<int:post_id>/restore', view_func=PostRestoreView.as_view('post_restore'),
+                 methods=['POST', ])
+app.add_url_rule('/posts/bulk', view_func=PostBulkView.as_view('posts_bulk'), methods=['POST', 'PATCH', 'DELETE'])
+app.add_url_rule('/posts/search', view_func=PostSearchView.as_view('posts_search'), methods=['GET', ])
+app.add_url_rule('/posts/changes', view_func=PostChangesView.as_view('posts_changes'), methods=['GET', ])
 app.add_url_rule('/users/', view_func=UserView.as_view('users_create'), methods=['POST', ])
 app.add_url_rule('/users/<int:user_id>', view_func=UserView.as_view('user_detail'), methods=['GET', ])
+app.add_url_rule('/users/<int:user_id>/posts', view_func=PostView.as_view('user_posts'), methods=['GET', ])
+
+app.add_url_rule('/auth/token', view_func=TokenView.as_view('auth_token'), methods=['POST', ])
 
-app.run()
+if __name__ == '__main__':
+    app.run()
@@ -0,0 +1,243 @@
+"""Асинхронная (ASGI) версия API: uvicorn asgi:app
+
+Те же маршруты /posts/ и /users/, что и в app.py, но на async-движке SQLAlchemy (asyncpg).
+Проверка и хэширование паролей выполняются в пуле процессов (hashing.py) и не блокируют event loop.
+Валидация (validate.py) и ошибки (ApiException) общие с синхронным приложением.
+"""
+import asyncio
+import contextlib
+from starlette.applications import Starlette
+from starlette.endpoints import HTTPEndpoint
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from db import User, Post, DSN, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, \
+    DB_STATEMENT_TIMEOUT
+from errors import ApiException
+from json_provider import dumps_bytes
+from validate import validate, UserCreateValidate, PostCreateValidate, PostUpdateValidate
+from auth import get_username_password_from_authdata, check_token, credential_cache
+from hashing import submit_hash_password, submit_check_password, needs_rehash
+from pagination import get_limit, encode_cursor
+from serializers import POST_FIELDS, get_post_fields, post_columns, post_serializer, serialize_post
+from counters import user_posts_added, user_posts_removed
+from changes import post_change_row, post_change_statements
+from views import filter_posts, invalidate_posts, invalidate_users, post_etag, parse_if_match, post_update_statement, \
+    post_update_error, post_delete_statement, post_restore_statement, post_delete_error
+
+async_engine = create_async_engine(DSN.replace('postgresql://', 'postgresql+asyncpg://', 1),
+                                   pool_size=DB_POOL_SIZE,
+                                   max_overflow=DB_MAX_OVERFLOW,
+                                   pool_timeout=DB_POOL_TIMEOUT,
+                                   pool_recycle=DB_POOL_RECYCLE,
+                                   pool_pre_ping=DB_POOL_PRE_PING,
+                                   connect_args={'server_settings': {'statement_timeout': str(DB_STATEMENT_TIMEOUT)}},
+                                   json_serializer=lambda obj: dumps_bytes(obj).decode())
+AsyncDBSession = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+class ApiJSONResponse(JSONResponse):
+    """ Та же сериализация, что и у Flask-приложения (json_provider)"""
+
+    def render(self, content):
+        return dumps_bytes(content)
+
+
+async def get_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise ApiException(400, 'invalid json')
+
+
+async def record_post_changes(session, rows: list):
+    for statement in post_change_statements(async_engine.dialect.name, rows):
+        await session.execute(statement)
+
+
+async def total_check_authentication(request):
+    """ Как auth.total_check_authentication, но без блокировки event loop"""
+    auth_from_headers = request.headers.get('Authorization')
+    if not auth_from_headers:
+        raise ApiException(401, 'authentication data has not been received')
+    scheme, _, credentials = auth_from_headers.partition(' ')
+    if scheme.lower() == 'bearer':
+        return check_token(credentials.strip())
+    cache_key = credential_cache.make_key(auth_from_headers)
+    user_id = credential_cache.get(cache_key)
+    if user_id is None:
+        username, password = get_username_password_from_authdata(auth_from_headers)
+        async with AsyncDBSession() as session:
+            user = (await session.execute(select(User.id, User.password).where(User.username == username))).first()
+            if user is None or not await asyncio.wrap_future(submit_check_password(user.password, password)):
+                raise ApiException(403, 'wrong username or password')
+            if needs_rehash(user.password):
+                try:
+                    new_hash = await asyncio.wrap_future(submit_hash_password(password))
+                except ApiException:
+                    pass  # пул хэширования занят - пересчитаем при следующем входе
+                else:
+                    await session.execute(update(User).where(User.id == user.id).values(password=new_hash))
+                    await session.commit()
+                    credential_cache.invalidate_user(user.id)
+        user_id = user.id
+        credential_cache.set(cache_key, user_id)
+    return user_id
+
+
+class PostEndpoint(HTTPEndpoint):
+    async def get(self, request):
+        fields = get_post_fields(request.query_params.get('fields'))
+        post_id = request.path_params.get('post_id')
+        async with AsyncDBSession() as session:
+            if post_id:
+                post = (await session.execute(select(*post_columns(fields))
+                                              .where(Post.id == post_id, Post.deleted_at.is_(None)))).first()
+                if post is None:
+                    raise ApiException(404, 'post not found')
+                return ApiJSONResponse(post_serializer(fields)(post))
+            limit = get_limit(request.query_params.get('limit'))
+            posts_query = filter_posts(select(*post_columns(fields, 'created', 'id')), request.query_params,
+                                       request.path_params.get('user_id')).limit(limit + 1)
+            rows = (await session.execute(posts_query)).all()
+        serialize = post_serializer(fields)
+        response = ApiJSONResponse([serialize(p) for p in rows[:limit]])
+        if len(rows) > limit:
+            response.headers['X-Next-Cursor'] = encode_cursor(rows[limit - 1].created, rows[limit - 1].id)
+        return response
+
+    async def post(self, request):
+        post_data = validate(await get_json(request), PostCreateValidate)
+        user_id = await total_check_authentication(request)
+        if post_data.get('user_id') != user_id:
+            raise ApiException(403, f'you are not allowed to set non-your user_id')
+        async with AsyncDBSession() as session:
+            new_post = Post(**post_data)
+            session.add(new_post)
+            await session.flush()
+            await session.execute(user_posts_added(user_id, 1, new_post.created))
+            post = serialize_post(new_post)
+            await record_post_changes(session, [post_change_row('created', post)])
+            await session.commit()
+        invalidate_posts(new_post.id)
+        invalidate_users(user_id)
+        return ApiJSONResponse(post)
+
+    async def patch(self, request):
+        post_id = request.path_params['post_id']
+        user_id = await total_check_authentication(request)
+        post_data = validate(await get_json(request), PostUpdateValidate, exclude_unset=True)
+        if post_data.get('user_id', user_id) != user_id:
+            raise ApiException(403, f'you are not allowed to change the user_id')
+        versions = parse_if_match(request.headers.get('If-Match'))
+        async with AsyncDBSession() as session:
+            statement = post_update_statement(post_id, user_id, post_data, versions)
+            if post_data:
+                statement = statement.returning(*post_columns(POST_FIELDS))
+            else:
+                # пустой PATCH: те же проверки, но без записи, новой версии и события в журнале
+                statement = select(*post_columns(POST_FIELDS)).where(statement.whereclause)
+            post = (await session.execute(statement)).first()
+            if post is None:
+                owner = await session.execute(select(Post.user_id, Post.version)
+                                              .where(Post.id == post_id, Post.deleted_at.is_(None)))
+                raise post_update_error(owner.first(), user_id)
+            post = serialize_post(post)
+            if post_data:
+                await record_post_changes(session, [post_change_row('updated', post)])
+                await session.commit()
+        if post_data:
+            invalidate_posts(post_id)
+        return ApiJSONResponse(post, headers={'ETag': f'"{post_etag(post)}"'})
+
+    async def delete(self, request):
+        post_id = request.path_params['post_id']
+        user_id = await total_check_authentication(request)
+        async with AsyncDBSession() as session:
+            if (await session.execute(post_delete_statement(post_id, user_id).returning(Post.id))).first() is None:
+                owner = await session.execute(select(Post.user_id, Post.deleted_at).where(Post.id == post_id))
+                raise post_delete_error(owner.first(), user_id)
+            await session.execute(user_posts_removed(user_id, 1))
+            await record_post_changes(session, [post_change_row('deleted', {'id': post_id, 'user_id': user_id})])
+            await session.commit()
+        invalidate_posts(post_id)
+        invalidate_users(user_id)
+        return ApiJSONResponse({'status': 'post deleted'})
+
+
+class PostRestoreEndpoint(HTTPEndpoint):
+    async def post(self, request):
+        post_id = request.path_params['post_id']
+        user_id = await total_check_authentication(request)
+        async with AsyncDBSession() as session:
+            post = (await session.execute(post_restore_statement(post_id, user_id)
+                                          .returning(*post_columns(POST_FIELDS)))).first()
+            if post is None:
+                owner = await session.execute(select(Post.user_id, Post.deleted_at).where(Post.id == post_id))
+                raise post_delete_error(owner.first(), user_id, 'restore')
+            await session.execute(user_posts_added(user_id, 1, post.created))
+            post = serialize_post(post)
+            await record_post_changes(session, [post_change_row('restored', post)])
+            await session.commit()
+        invalidate_posts(post_id)
+        invalidate_users(user_id)
+        return ApiJSONResponse(post)
+
+
+class UserEndpoint(HTTPEndpoint):
+    async def get(self, request):
+        async with AsyncDBSession() as session:
+            user = (await session.execute(select(User.id, User.username, User.post_count, User.last_post_at)
+                                          .where(User.id == request.path_params['user_id']))).first()
+        if user is None:
+            raise ApiException(404, 'user not found')
+        return ApiJSONResponse({'id': user.id,
+                                'username': user.username,
+                                'post_count': user.post_count,
+                                'last_post_at': user.last_post_at,
+                                })
+
+    async def post(self, request):
+        user_data = validate(await get_json(request), UserCreateValidate)
+        user_data['password'] = await asyncio.wrap_future(submit_hash_password(user_data['password']))
+        async with AsyncDBSession() as session:
+            new_user = User(**user_data)
+            session.add(new_user)
+            try:
+                await session.commit()
+            except IntegrityError:
+                raise ApiException(400, 'field is not unique')
+        return ApiJSONResponse({'id': new_user.id,
+                                'username': new_user.username,
+                                'email': new_user.email
+                                })
+
+
+async def error_handler(request, error: ApiException):
+    return ApiJSONResponse({'status': 'error', 'message': error.message}, status_code=error.status_code,
+                           headers=error.headers)
+
+
+async def index(request):
+    return ApiJSONResponse({'check': 'Ok'})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_engine.dispose()
+
+
+app = Starlette(routes=[Route('/', index),
+                        Route('/index', index),
+                        Route('/posts/', PostEndpoint, methods=['GET', 'POST']),
+                        Route('/posts/{post_id:int}', PostEndpoint, methods=['GET', 'PATCH', 'DELETE']),
+                        Route('/posts/{post_id:int}/restore', PostRestoreEndpoint, methods=['POST']),
+                        Route('/users/', UserEndpoint, methods=['POST']),
+                        Route('/users/{user_id:int}', UserEndpoint, methods=['GET']),
+                        Route('/users/{user_id:int}/posts', PostEndpoint, methods=['GET'])],
+                exception_handlers={ApiException: error_handler},
+                lifespan=lifespan)
@@ -1,11 +1,85 @@
+import os
 import base64
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
 from db import User, Session
-from werkzeug.security import generate_password_hash, check_password_hash
+from hashing import submit_hash_password, submit_check_password, needs_rehash
 from errors import ApiException
+from metrics import password_hash_duration
+
+
+CREDENTIAL_CACHE_SIZE = int(os.getenv('CREDENTIAL_CACHE_SIZE', 10000))
+CREDENTIAL_CACHE_TTL = float(os.getenv('CREDENTIAL_CACHE_TTL', 300))
+
+
+class CredentialCache:
+    """ LRU-кэш проверенных Authorization-заголовков: digest заголовка -> user_id"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def make_key(self, auth_from_headers: str):
+        return hmac.new(self._secret, auth_from_headers.encode(), hashlib.sha256).digest()
+
+    def get(self, key: bytes):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: bytes):
+        """ Как get, но без счётчиков и без обновления порядка LRU"""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, key: bytes, user_id: int):
+        with self._lock:
+            self._entries[key] = (user_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        """ Вызывать при смене пароля пользователя"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == user_id]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+credential_cache = CredentialCache(CREDENTIAL_CACHE_SIZE, CREDENTIAL_CACHE_TTL)
+
+TOKEN_SECRET = os.getenv('TOKEN_SECRET', '').encode()
+if not TOKEN_SECRET:
+    # случайный ключ в каждом процессе: токен одного воркера отклонялся бы остальными
+    raise RuntimeError('TOKEN_SECRET is not set')
+TOKEN_TTL = int(os.getenv('TOKEN_TTL', 3600))
 
 
 def hash_password(password: str):
-    hashed = generate_password_hash(password)
+    started = time.perf_counter()
+    hashed = submit_hash_password(password).result()
+    password_hash_duration.observe(time.perf_counter() - started, 'hash')
     return hashed
 
 
@@ -20,13 +94,71 @@ def is_authenticated(username, password):
     """Проверка аутентификации"""
     with Session() as session:
         user = session.query(User).filter(User.username == username).first()
-        if user and check_password_hash(user.password, password):
+        started = time.perf_counter()
+        password_ok = user is not None and submit_check_password(user.password, password).result()
+        password_hash_duration.observe(time.perf_counter() - started, 'check')
+        if password_ok:
+            if needs_rehash(user.password):
+                # параметры хэширования поменялись - пересчитываем хэш, пока знаем пароль
+                try:
+                    user.password = hash_password(password)
+                except ApiException:
+                    pass  # пул хэширования занят - пересчитаем при следующем входе
+                else:
+                    session.commit()
+                    credential_cache.invalidate_user(user.id)
             return user.id
         else:
             raise ApiException(403, 'wrong username or password')
 
 
+def sign_token_payload(payload: str):
+    signature = hmac.new(TOKEN_SECRET, payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(signature).decode().rstrip('=')
+
+
+def create_token(user_id: int):
+    """ Токен вида '<user_id>.<expires>.<подпись>'"""
+    payload = f'{user_id}.{int(time.time()) + TOKEN_TTL}'
+    return f'{payload}.{sign_token_payload(payload)}'
+
+
+def check_token(token: str):
+    """ Проверка bearer-токена без обращения к базе"""
+    payload, _, signature = token.rpartition('.')
+    # байты: compare_digest не сравнивает строки с не-ASCII символами (TypeError)
+    if not payload or not hmac.compare_digest(signature.encode(), sign_token_payload(payload).encode()):
+        raise ApiException(403, 'invalid token')
+    user_id, expires = payload.split('.')
+    if int(expires) < time.time():
+        raise ApiException(403, 'token expired')
+    return int(user_id)
+
+
 def total_check_authentication(auth_from_headers):
-    username, password = get_username_password_from_authdata(auth_from_headers)
-    user_id = is_authenticated(username, password)
+    scheme, _, credentials = auth_from_headers.partition(' ')
+    if scheme.lower() == 'bearer':
+        return check_token(credentials.strip())
+    cache_key = credential_cache.make_key(auth_from_headers)
+    user_id = credential_cache.get(cache_key)
+    if user_id is None:
+        username, password = get_username_password_from_authdata(auth_from_headers)
+        user_id = is_authenticated(username, password)
+        credential_cache.set(cache_key, user_id)
     return user_id
+
+
+def get_client_key(auth_from_headers, remote_addr):
+    """ Пользователь по токену или по уже проверенным Basic-данным (без хэширования), иначе IP"""
+    if auth_from_headers:
+        scheme, _, credentials = auth_from_headers.partition(' ')
+        if scheme.lower() == 'bearer':
+            try:
+                return f'user:{check_token(credentials.strip())}'
+            except (ApiException, ValueError):
+                pass
+        else:
+            user_id = credential_cache.peek(credential_cache.make_key(auth_from_headers))
+            if user_id is not None:
+                return f'user:{user_id}'
+    return f'ip:{remote_addr}'
@@ -0,0 +1,244 @@
+"""Нагрузочный тест API: python benchmark.py --users 20 --posts 5000 --requests 500 --concurrency 8
+
+Заполняет базу из db.py (DATABASE_URL или POSTGRES_* из .env - используйте отдельную базу),
+затем параллельно гоняет запросы к приложению: в процессе через Flask test client (по умолчанию)
+или к запущенному серверу (--url http://127.0.0.1:5000, сервер должен смотреть в ту же базу).
+Для каждого сценария считает RPS и p50/p95/p99, результат сохраняет в json (--output),
+--compare печатает разницу с предыдущим прогоном.
+python benchmark.py --validation - только стоимость проверки одного элемента тела запроса (без базы).
+"""
+import argparse
+import base64
+import json
+import random
+import statistics
+import threading
+import time
+import timeit
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import insert
+from db import Base, Session, User, Post, engine
+from hashing import submit_hash_password
+from validate import validate_values, validate_many, PostCreateValidate, UserCreateValidate
+
+SCENARIOS = ('list_posts', 'get_post', 'create_post', 'update_post', 'delete_post', 'get_user', 'create_user')
+
+
+def basic_auth(username: str, password: str):
+    return {'Authorization': 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()}
+
+
+class FlaskTarget:
+    """ Запросы через test client, без сети"""
+
+    def __init__(self):
+        from app import app
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, json=None, headers=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client.open(path, method=method, json=json, headers=headers).status_code
+
+
+class HttpTarget:
+    """ Запросы к запущенному серверу"""
+
+    def __init__(self, url: str):
+        import requests
+        self.url = url.rstrip('/')
+        self._requests = requests
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, json=None, headers=None):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        return session.request(method, self.url + path, json=json, headers=headers).status_code
+
+
+def seed(users: int, posts: int, deletable: int):
+    """ Пользователи с паролем 'bench' и их объявления; deletable - объявления для сценария delete_post"""
+    Base.metadata.create_all(engine)
+    run_id = uuid.uuid4().hex[:8]
+    hashes = [submit_hash_password('bench') for _ in range(users)]
+    with Session() as session:
+        new_users = [User(username=f'bench_{run_id}_{number}', email=f'bench_{run_id}_{number}@bench.org',
+                          password=password_hash.result()) for number, password_hash in enumerate(hashes)]
+        session.add_all(new_users)
+        session.commit()
+        user_ids = [user.id for user in new_users]
+        usernames = {user.id: user.username for user in new_users}
+        post_ids = {}
+        for kind, count in (('posts', posts), ('deletable', deletable)):
+            title = f'Benchmark {run_id} {kind}'
+            rows = [{'title': title, 'content': 'Lorem ipsum dolor sit amet. ' * 20,
+                     'created': datetime.now(), 'user_id': user_ids[number % users]} for number in range(count)]
+            for start in range(0, len(rows), 1000):
+                session.execute(insert(Post.__table__), rows[start:start + 1000])
+            post_ids[kind] = session.query(Post.id, Post.user_id).filter(Post.title == title).all()
+        session.commit()
+    return {'run_id': run_id, 'user_ids': user_ids, 'usernames': usernames,
+            'posts': post_ids['posts'], 'deletable': post_ids['deletable']}
+
+
+def make_scenario(name: str, data: dict):
+    """ Функция одного запроса сценария: () -> (метод, путь, json, headers)"""
+    auth = {user_id: basic_auth(username, 'bench') for user_id, username in data['usernames'].items()}
+    deletable = list(data['deletable'])
+    deletable_lock = threading.Lock()
+    counter = iter(range(10 ** 9))
+
+    def list_posts():
+        return 'GET', '/posts/?limit=100', None, None
+
+    def get_post():
+        return 'GET', f'/posts/{random.choice(data["posts"])[0]}', None, None
+
+    def create_post():
+        user_id = random.choice(data['user_ids'])
+        return 'POST', '/posts/', {'title': 'New', 'content': 'Benchmark', 'user_id': user_id}, auth[user_id]
+
+    def update_post():
+        post_id, user_id = random.choice(data['posts'])
+        return 'PATCH', f'/posts/{post_id}', {'title': f'Updated {time.time()}'}, auth[user_id]
+
+    def delete_post():
+        with deletable_lock:
+            post_id, user_id = deletable.pop()
+        return 'DELETE', f'/posts/{post_id}', None, auth[user_id]
+
+    def get_user():
+        return 'GET', f'/users/{random.choice(data["user_ids"])}', None, None
+
+    def create_user():
+        number = next(counter)
+        username = f'new_{data["run_id"]}_{number}'
+        return 'POST', '/users/', {'username': username, 'email': f'{username}@bench.org',
+                                   'password': f'p{number}'}, None
+
+    return locals()[name]
+
+
+def run_scenario(target, scenario, requests_count: int, concurrency: int):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one_request(_):
+        nonlocal errors
+        method, path, body, headers = scenario()
+        started = time.perf_counter()
+        status_code = target.request(method, path, json=body, headers=headers)
+        latency = time.perf_counter() - started
+        with lock:
+            latencies.append(latency)
+            if status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one_request, range(requests_count)))
+    elapsed = time.perf_counter() - started
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 \
+        else latencies * 99
+    return {'requests': len(latencies),
+            'errors': errors,
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentiles[49] * 1000, 2),
+            'p95_ms': round(percentiles[94] * 1000, 2),
+            'p99_ms': round(percentiles[98] * 1000, 2)}
+
+
+def run_benchmark(users: int, posts: int, requests_count: int, concurrency: int, url: str | None = None,
+                  scenarios=SCENARIOS):
+    target = HttpTarget(url) if url else FlaskTarget()
+    data = seed(users, posts, requests_count if 'delete_post' in scenarios else 0)
+    results = {}
+    for name in scenarios:
+        results[name] = run_scenario(target, make_scenario(name, data), requests_count, concurrency)
+    return {'started': datetime.now().isoformat(timespec='seconds'),
+            'target': url or 'flask test client',
+            'database': engine.dialect.name,
+            'users': users,
+            'posts': posts,
+            'requests': requests_count,
+            'concurrency': concurrency,
+            'results': results}
+
+
+VALIDATION_SAMPLES = {
+    PostCreateValidate: {'title': 'Benchmark', 'content': 'Lorem ipsum dolor sit amet. ' * 20, 'user_id': 1},
+    UserCreateValidate: {'username': 'bench', 'email': 'bench@bench.org', 'password': 'bench'},
+}
+
+
+def run_validation_benchmark(number: int = 20000, batch_size: int = 1000):
+    """ Микросекунд на элемент: прежний способ (модель + .dict()), validate_values и validate_many"""
+    results = {}
+    for validate_class, data in VALIDATION_SAMPLES.items():
+        batch = [data] * batch_size
+        batches = max(1, number // batch_size)
+        results[validate_class.__name__] = {
+            'model_dict_us': round(timeit.timeit(lambda: validate_class(**data).dict(), number=number)
+                                   / number * 1e6, 2),
+            'validate_us': round(timeit.timeit(lambda: validate_values(data, validate_class), number=number)
+                                 / number * 1e6, 2),
+            'validate_many_us': round(timeit.timeit(lambda: validate_many(batch, validate_class), number=batches)
+                                      / (batches * batch_size) * 1e6, 2)}
+    return results
+
+
+def print_validation_report(results: dict):
+    print(f'{"model":<22}{"model+dict us":>15}{"validate us":>13}{"validate_many us":>18}')
+    for name, result in results.items():
+        print(f'{name:<22}{result["model_dict_us"]:>15}{result["validate_us"]:>13}{result["validate_many_us"]:>18}')
+
+
+def print_report(report: dict, previous: dict | None = None):
+    print(f'{report["target"]}, {report["database"]}, concurrency {report["concurrency"]}')
+    print(f'{"scenario":<14}{"rps":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for name, result in report['results'].items():
+        line = f'{name:<14}{result["rps"]:>10}{result["p50_ms"]:>10}{result["p95_ms"]:>10}' \
+               f'{result["p99_ms"]:>10}{result["errors"]:>8}'
+        old = previous['results'].get(name) if previous else None
+        if old:
+            line += f'   rps {result["rps"] - old["rps"]:+.1f}, p95 {result["p95_ms"] - old["p95_ms"]:+.2f} ms'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='posts API benchmark')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--url', help='running server instead of the in-process test client')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--output', default=f'benchmark_{datetime.now():%Y%m%d_%H%M%S}.json')
+    parser.add_argument('--compare', help='previous result json')
+    parser.add_argument('--validation', action='store_true', help='only request body validation cost per item')
+    args = parser.parse_args()
+
+    if args.validation:
+        print_validation_report(run_validation_benchmark())
+        return
+
+    report = run_benchmark(args.users, args.posts, args.requests, args.concurrency, args.url,
+                           args.scenarios.split(','))
+    previous = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)
+    print_report(report, previous)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
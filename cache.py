@@ -0,0 +1,128 @@
+import os
+import hashlib
+import threading
+import itertools
+import time
+from collections import OrderedDict, namedtuple
+from flask import Response, request
+from json_provider import dumps_bytes
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+CACHE_URL = os.getenv('CACHE_URL')
+CACHE_SIZE = int(os.getenv('CACHE_SIZE', 10000))
+CACHE_TTL = int(os.getenv('CACHE_TTL', 60))
+
+CacheEntry = namedtuple('CacheEntry', ['body', 'etag'])
+
+
+class LRUCache:
+    """ Кэш в памяти процесса (у каждого воркера свой)"""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}  # ключ -> номер последнего delete
+        self._generation_floor = 0  # поколение ключей, забытых при очистке _generations
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            entry, expires = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def generation(self, key: str):
+        with self._lock:
+            return self._generations.get(key, self._generation_floor)
+
+    def set(self, key: str, entry: CacheEntry, generation: int):
+        """ Запись, только если с момента generation(key) ключ не сбрасывали"""
+        with self._lock:
+            if self._generations.get(key, self._generation_floor) != generation:
+                return
+            self._entries[key] = (entry, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generations[key] = next(self._counter)
+            if len(self._generations) > self.max_size:
+                # новое общее поколение больше любого выданного: незавершённые заполнения просто не сохранятся
+                self._generations.clear()
+                self._generation_floor = next(self._counter)
+
+
+class RedisCache:
+    """ Общий для всех воркеров кэш (redis или совместимый сервер).
+    Поколение ключа - счётчик '<ключ>:generation', delete увеличивает его"""
+
+    SET_SCRIPT = '''
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[3] then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+end
+'''
+
+    def __init__(self, url: str, ttl: int):
+        if redis is None:
+            raise RuntimeError('CACHE_URL is set, but redis package is not installed')
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+        self._set_script = self._client.register_script(self.SET_SCRIPT)
+
+    def get(self, key: str):
+        value = self._client.get(key)
+        if value is None:
+            return None
+        etag, body = value.split(b'\n', 1)
+        return CacheEntry(body, etag.decode())
+
+    def generation(self, key: str):
+        return int(self._client.get(f'{key}:generation') or 0)
+
+    def set(self, key: str, entry: CacheEntry, generation: int):
+        """ Запись, только если с момента generation(key) ключ не сбрасывали (проверка и запись - в одном скрипте)"""
+        self._set_script(keys=[key, f'{key}:generation'],
+                         args=[f'{entry.etag}\n'.encode() + entry.body, self.ttl, generation])
+
+    def delete(self, key: str):
+        pipeline = self._client.pipeline()
+        pipeline.incr(f'{key}:generation')
+        # счётчик должен пережить заполнение, начатое до delete; дольше TTL оно не длится
+        pipeline.expire(f'{key}:generation', self.ttl)
+        pipeline.delete(key)
+        pipeline.execute()
+
+
+response_cache = RedisCache(CACHE_URL, CACHE_TTL) if CACHE_URL else LRUCache(CACHE_SIZE, CACHE_TTL)
+
+
+def cached_json_response(key: str, load, make_etag=None):
+    """ Ответ из кэша, иначе load() -> dict сериализуется и кладётся в кэш.
+    ETag (make_etag(dict) или хэш ответа) позволяет отвечать 304 без сериализации"""
+    entry = response_cache.get(key)
+    if entry is None:
+        generation = response_cache.generation(key)
+        data = load()
+        body = dumps_bytes(data)
+        etag = make_etag(data) if make_etag else hashlib.blake2b(body, digest_size=16).hexdigest()
+        entry = CacheEntry(body, etag)
+        # если изменение закоммитили и сбросили ключ во время load(), прочитанный ответ уже устарел - не кэшируем
+        response_cache.set(key, entry, generation)
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    return response.make_conditional(request)
@@ -0,0 +1,98 @@
+"""Журнал изменений объявлений: GET /posts/changes?since=<seq>
+
+Каждое создание, изменение и удаление объявления добавляет строку в post_change в той же
+транзакции (post_change_statements), поэтому журнал не расходится с post_table.
+Потребители читают события после последнего полученного seq: сразу, с ожиданием (wait)
+или потоком Server-Sent Events.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select, insert, func
+from db import PostChange, Session
+
+CHANGES_MAX_WAIT = int(os.getenv('CHANGES_MAX_WAIT', 30))  # с, предел ожидания long-poll
+CHANGES_POLL_INTERVAL = float(os.getenv('CHANGES_POLL_INTERVAL', 1))  # с, проверка изменений других процессов
+CHANGES_KEEPALIVE = int(os.getenv('CHANGES_KEEPALIVE', 15))  # с, комментарий в SSE-потоке без событий
+CHANGES_LOCK_ID = 7319  # ключ pg_advisory_xact_lock для записи журнала
+
+
+def post_change_row(operation: str, post: dict):
+    """ Событие по объявлению (dict из serialize_post); для deleted достаточно id и user_id"""
+    return {'operation': operation,
+            'post_id': post['id'],
+            'user_id': post['user_id'],
+            'version': post.get('version'),
+            'post': post if operation != 'deleted' else None,
+            'created': datetime.now()}
+
+
+def post_change_statements(dialect_name: str, rows: list):
+    """ Запросы записи событий - последний шаг транзакции перед commit.
+    В PostgreSQL seq выдаётся до commit, поэтому запись журнала сериализуется advisory-блокировкой
+    до конца транзакции: события с меньшим seq никогда не появятся после уже прочитанных"""
+    if not rows:
+        return []
+    statements = [insert(PostChange.__table__).values(rows)]
+    if dialect_name == 'postgresql':
+        statements.insert(0, select(func.pg_advisory_xact_lock(CHANGES_LOCK_ID)))
+    return statements
+
+
+def record_post_changes(session, rows: list):
+    for statement in post_change_statements(session.bind.dialect.name, rows):
+        session.execute(statement)
+
+
+class ChangeNotifier:
+    """ Будит ожидающие запросы после commit изменений в этом процессе"""
+
+    def __init__(self):
+        self._version = 0
+        self._condition = threading.Condition()
+
+    @property
+    def version(self):
+        return self._version
+
+    def notify(self):
+        with self._condition:
+            self._version += 1
+            self._condition.notify_all()
+
+    def wait(self, version: int, timeout: float):
+        with self._condition:
+            self._condition.wait_for(lambda: self._version != version, timeout)
+
+
+change_notifier = ChangeNotifier()
+
+
+def serialize_change(change):
+    return {'seq': change.seq,
+            'operation': change.operation,
+            'post_id': change.post_id,
+            'user_id': change.user_id,
+            'version': change.version,
+            'created': change.created,
+            'post': change.post}
+
+
+def load_changes(since: int, limit: int):
+    with Session() as session:
+        changes = session.query(PostChange).filter(PostChange.seq > since).order_by(PostChange.seq).limit(limit)
+        return [serialize_change(change) for change in changes]
+
+
+def wait_for_changes(since: int, limit: int, wait: float):
+    """ События после since; если их нет - ждём до wait секунд. Изменения других воркеров
+    замечаются не позже чем через CHANGES_POLL_INTERVAL, соединение с базой между проверками не держим"""
+    deadline = time.monotonic() + wait
+    while True:
+        version = change_notifier.version
+        changes = load_changes(since, limit)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes
+        change_notifier.wait(version, min(remaining, CHANGES_POLL_INTERVAL))
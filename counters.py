@@ -0,0 +1,48 @@
+"""Счётчики объявлений пользователя: python counters.py
+
+post_count и last_post_at в user_table (по неудалённым объявлениям) меняются в той же транзакции,
+что и объявления (user_posts_added / user_posts_removed). Запуск модуля пересчитывает их по post_table
+и исправляет расхождения (например, после изменений в базе в обход API).
+"""
+from sqlalchemy import select, update, func, case, or_
+from db import User, Post, engine
+
+
+def last_post_created(user_id):
+    """ Время последнего объявления пользователя (индекс ix_post_user_created)"""
+    return select(func.max(Post.created)).where(Post.user_id == user_id, Post.deleted_at.is_(None)).scalar_subquery()
+
+
+def user_posts_added(user_id: int, count: int, created):
+    """ UPDATE после вставки count объявлений, самое позднее из которых создано в created"""
+    return update(User.__table__).where(User.id == user_id).values(
+        post_count=User.post_count + count,
+        last_post_at=case((or_(User.last_post_at.is_(None), User.last_post_at < created), created),
+                          else_=User.last_post_at))
+
+
+def user_posts_removed(user_id: int, count: int):
+    """ UPDATE после удаления count объявлений (выполняется после удаления в той же транзакции)"""
+    return update(User.__table__).where(User.id == user_id).values(
+        post_count=User.post_count - count,
+        last_post_at=last_post_created(user_id))
+
+
+def reconcile_statement():
+    """ UPDATE пользователей, у которых счётчики расходятся с post_table"""
+    post_count = select(func.count(Post.id)).where(Post.user_id == User.id, Post.deleted_at.is_(None))\
+        .scalar_subquery()
+    last_post_at = last_post_created(User.id)
+    return update(User.__table__)\
+        .where(or_(User.post_count != post_count, User.last_post_at.is_distinct_from(last_post_at)))\
+        .values(post_count=post_count, last_post_at=last_post_at)
+
+
+def reconcile():
+    """ Количество исправленных пользователей"""
+    with engine.begin() as connection:
+        return connection.execute(reconcile_statement()).rowcount
+
+
+if __name__ == '__main__':
+    print(f'fixed users: {reconcile()}')
@@ -1,4 +1,5 @@
 class ApiException(Exception):
-    def __init__(self, status_code: int, message: str | dict | list):
+    def __init__(self, status_code: int, message: str | dict | list, headers: dict | None = None):
         self.status_code = status_code
         self.message = message
+        self.headers = headers or {}
@@ -0,0 +1,78 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from errors import ApiException
+
+# формат werkzeug: 'scrypt:n:r:p' или 'pbkdf2:sha256:iterations'
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_SALT_LENGTH = int(os.getenv('PASSWORD_SALT_LENGTH', 16))
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', os.cpu_count() or 1))
+HASH_QUEUE_SIZE = int(os.getenv('HASH_QUEUE_SIZE', HASH_WORKERS * 4))
+HASH_RETRY_AFTER = int(os.getenv('HASH_RETRY_AFTER', 1))
+
+
+def hash_method_prefix(method: str):
+    """ Метод так, как werkzeug записывает его в хэш: 'scrypt' -> 'scrypt:32768:8:1'.
+    Умолчания werkzeug подставляются без расчёта хэша - импорт не тратит время и память каждого воркера"""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return 'scrypt:' + ':'.join(map(str, map(int, args) if args else (2 ** 15, 8, 1)))
+    if name == 'pbkdf2':
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{args[0] if args else "sha256"}:{iterations}'
+    raise ValueError(f'unknown password hash method {method!r}')
+
+
+PASSWORD_HASH_PREFIX = hash_method_prefix(PASSWORD_HASH_METHOD)
+
+
+class HashingService:
+    """ Хэширование паролей в пуле процессов, чтобы не занимать GIL потоков запросов.
+    Одновременно принимается не больше queue_size задач, остальным - 503 с Retry-After"""
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def submit(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise ApiException(503, 'server is busy, retry later', {'Retry-After': str(HASH_RETRY_AFTER)})
+        try:
+            future = self.get_executor().submit(function, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+hashing_service = HashingService(HASH_WORKERS, HASH_QUEUE_SIZE)
+
+
+def submit_hash_password(password: str):
+    return hashing_service.submit(generate_password_hash, password, PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH)
+
+
+def submit_check_password(password_hash: str, password: str):
+    return hashing_service.submit(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash: str):
+    """ Хэш посчитан с другими параметрами, чем PASSWORD_HASH_METHOD"""
+    return password_hash.split('$', 1)[0] != PASSWORD_HASH_PREFIX
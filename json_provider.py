@@ -0,0 +1,47 @@
+import json
+from datetime import date
+from decimal import Decimal
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(value):
+    """ Даты - в ISO 8601"""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    def dumps_bytes(obj):
+        return orjson.dumps(obj, default=json_default)
+
+    loads = orjson.loads
+else:
+    def dumps_bytes(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=json_default).encode()
+
+    loads = json.loads
+
+
+class FastJSONProvider(JSONProvider):
+    """ JSON для Flask: orjson, если установлен, иначе стандартный json.
+    Ответ собирается сразу в bytes, без промежуточной строки"""
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
@@ -0,0 +1,153 @@
+import os
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from flask import Response, request
+from sqlalchemy import event
+
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 0))  # 0 - не писать медленные запросы в лог
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger('slow_requests')
+registry = []
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labelnames, labels, extra=''):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                bucket_labels = format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}')
+        return '\n'.join(lines)
+
+
+class GaugeFunction:
+    """ Значение считывается функцией в момент запроса /metrics"""
+
+    def __init__(self, name: str, documentation: str, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        registry.append(self)
+
+    def render(self):
+        return f'# HELP {self.name} {self.documentation}\n# TYPE {self.name} gauge\n{self.name} {self.function()}'
+
+
+class CounterFunction(GaugeFunction):
+    """ Растущий счётчик, значение считывается функцией в момент запроса /metrics"""
+
+    def render(self):
+        return f'# HELP {self.name} {self.documentation}\n# TYPE {self.name} counter\n{self.name} {self.function()}'
+
+
+def render_metrics():
+    return '\n'.join(metric.render() for metric in registry) + '\n'
+
+
+request_duration = Histogram('http_request_duration_seconds', 'Request latency', ('method', 'route', 'status'))
+request_sql_statements = Histogram('http_request_sql_statements', 'SQL statements per request',
+                                   ('method', 'route'), COUNT_BUCKETS)
+request_sql_duration = Histogram('http_request_sql_duration_seconds', 'SQL time per request', ('method', 'route'))
+password_hash_duration = Histogram('password_hash_duration_seconds', 'Password hash/check time', ('operation',))
+validation_duration = Histogram('validation_duration_seconds', 'Request body validation time', ('model',))
+
+
+class RequestStats:
+    __slots__ = ('started', 'sql_count', 'sql_time', 'statements')
+
+    def __init__(self, capture_statements: bool):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements = [] if capture_statements else None
+
+
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+def instrument_engine(engine):
+    """ Счётчик и время SQL-запросов текущего HTTP-запроса"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        stats = current_request.get()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_time += elapsed
+            if stats.statements is not None:
+                stats.statements.append((elapsed, statement))
+
+
+def init_app(app):
+    """ Замеры по каждому запросу Flask-приложения и маршрут /metrics"""
+
+    @app.before_request
+    def start_request_stats():
+        current_request.set(RequestStats(SLOW_REQUEST_SECONDS > 0))
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = current_request.get()
+        if stats is None:
+            return response
+        current_request.set(None)
+        elapsed = time.perf_counter() - stats.started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_duration.observe(elapsed, request.method, route, response.status_code)
+        request_sql_statements.observe(stats.sql_count, request.method, route)
+        request_sql_duration.observe(stats.sql_time, request.method, route)
+        if SLOW_REQUEST_SECONDS and elapsed > SLOW_REQUEST_SECONDS:
+            statements = '\n'.join(f'  {duration * 1000:.1f} ms: {statement}'
+                                   for duration, statement in stats.statements)
+            logger.warning('slow request %s %s: %.3f s, %d sql statements (%.3f s)\n%s', request.method,
+                           request.full_path, elapsed, stats.sql_count, stats.sql_time, statements)
+        return response
+
+    @app.route('/metrics')
+    def metrics_view():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
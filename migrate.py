@@ -0,0 +1,67 @@
+"""Управление схемой базы: python migrate.py
+
+Запускается отдельно от приложения (перед стартом воркеров).
+На пустой базе создаёт все таблицы по моделям из db.py, на существующей - применяет
+недостающие миграции из MIGRATIONS. Повторный запуск ничего не меняет.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+from db import Base, PostChange, engine, SEARCH_VECTOR_DDL
+from counters import reconcile_statement
+
+# (версия, SQL-команды: строки или выражения SQLAlchemy). Новые миграции добавляются только в конец списка
+MIGRATIONS = [
+    (1, []),  # исходная схема: user_table, post_table
+    (2, SEARCH_VECTOR_DDL),
+    (3, ['CREATE INDEX IF NOT EXISTS ix_post_created ON post_table (created, id)',
+         'CREATE INDEX IF NOT EXISTS ix_post_user_created ON post_table (user_id, created, id)']),
+    (4, ['ALTER TABLE post_table ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1']),
+    (5, ['ALTER TABLE user_table ADD COLUMN IF NOT EXISTS post_count INTEGER NOT NULL DEFAULT 0',
+         'ALTER TABLE user_table ADD COLUMN IF NOT EXISTS last_post_at TIMESTAMP WITHOUT TIME ZONE',
+         'UPDATE user_table SET post_count = (SELECT count(*) FROM post_table WHERE user_id = user_table.id), '
+         'last_post_at = (SELECT max(created) FROM post_table WHERE user_id = user_table.id)']),
+    (6, [CreateTable(PostChange.__table__, if_not_exists=True)]),
+    (7, ['ALTER TABLE post_table ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITHOUT TIME ZONE',
+         'DROP INDEX IF EXISTS ix_post_created',
+         'CREATE INDEX ix_post_created ON post_table (created, id) WHERE deleted_at IS NULL',
+         'DROP INDEX IF EXISTS ix_post_user_created',
+         'CREATE INDEX ix_post_user_created ON post_table (user_id, created, id) WHERE deleted_at IS NULL',
+         'CREATE INDEX IF NOT EXISTS ix_post_deleted_at ON post_table (deleted_at) WHERE deleted_at IS NOT NULL',
+         reconcile_statement()]),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(connection):
+    return connection.execute(text('SELECT version FROM schema_version')).scalar()
+
+
+def set_version(connection, version: int):
+    connection.execute(text('UPDATE schema_version SET version = :version'), {'version': version})
+
+
+def migrate():
+    with engine.begin() as connection:
+        tables = inspect(connection).get_table_names()
+        if 'schema_version' not in tables:
+            connection.execute(text('CREATE TABLE schema_version (version INTEGER NOT NULL)'))
+            if 'user_table' in tables:
+                version = 1  # база создана до появления миграций
+            else:
+                Base.metadata.create_all(connection)
+                version = LATEST_VERSION
+            connection.execute(text('INSERT INTO schema_version (version) VALUES (:version)'),
+                               {'version': version})
+        current_version = get_version(connection)
+        for version, statements in MIGRATIONS:
+            if version <= current_version:
+                continue
+            for statement in statements:
+                connection.execute(text(statement) if isinstance(statement, str) else statement)
+            set_version(connection, version)
+            print(f'applied migration {version}')
+        print(f'schema version: {get_version(connection)}')
+
+
+if __name__ == '__main__':
+    migrate()
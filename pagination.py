@@ -0,0 +1,74 @@
+import base64
+from datetime import datetime
+from errors import ApiException
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_BATCH_SIZE = 500
+
+
+def get_limit(limit_from_args):
+    """ Получаем размер страницы из query-параметра limit"""
+    if limit_from_args is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(limit_from_args)
+    except ValueError:
+        raise ApiException(400, 'invalid limit')
+    if limit < 1:
+        raise ApiException(400, 'invalid limit')
+    return min(limit, MAX_LIMIT)
+
+
+def get_int(value_from_args, name: str):
+    if value_from_args is None:
+        return None
+    try:
+        return int(value_from_args)
+    except ValueError:
+        raise ApiException(400, f'invalid {name}')
+
+
+def get_datetime(value_from_args, name: str):
+    """ Дата в формате ISO 8601 из query-параметра"""
+    if value_from_args is None:
+        return None
+    try:
+        return datetime.fromisoformat(value_from_args)
+    except ValueError:
+        raise ApiException(400, f'invalid {name}')
+
+
+def get_order(order_from_args):
+    order = order_from_args or 'asc'
+    if order not in ('asc', 'desc'):
+        raise ApiException(400, 'order must be asc or desc')
+    return order
+
+
+def encode_cursor(created: datetime, post_id: int):
+    """ Курсор - позиция (created, id) последнего отданного объявления"""
+    raw = f'{created.isoformat()},{post_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        created, post_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(',')
+        return datetime.fromisoformat(created), int(post_id)
+    except ValueError:
+        raise ApiException(400, 'invalid cursor')
+
+
+def encode_rank_cursor(rank: float, post_id: int):
+    """ Курсор для выдачи, отсортированной по релевантности"""
+    raw = f'{rank!r},{post_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_rank_cursor(cursor: str):
+    try:
+        rank, post_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(',')
+        return float(rank), int(post_id)
+    except ValueError:
+        raise ApiException(400, 'invalid cursor')
@@ -0,0 +1,56 @@
+"""Окончательное удаление объявлений: python purge.py [--loop]
+
+DELETE в API только отмечает объявление (deleted_at), его можно восстановить
+(POST /posts/<id>/restore). Объявления, удалённые больше PURGE_AFTER секунд назад,
+удаляются отсюда небольшими пачками с паузами, чтобы не держать долгих блокировок.
+Запускается по расписанию (cron, в часы наименьшей нагрузки) или постоянно с --loop.
+"""
+import os
+import time
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete
+from db import Post, engine
+
+PURGE_AFTER = int(os.getenv('PURGE_AFTER', 7 * 24 * 3600))  # с, сколько удалённое объявление можно восстановить
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 500))
+PURGE_PAUSE = float(os.getenv('PURGE_PAUSE', 0.5))  # с, между пачками
+PURGE_INTERVAL = int(os.getenv('PURGE_INTERVAL', 600))  # с, между запусками с --loop
+
+
+def purge_batch(connection, deleted_before: datetime, batch_size: int):
+    """ Одна пачка по индексу ix_post_deleted_at; занятые другими транзакциями строки пропускаются"""
+    post_ids = select(Post.id).where(Post.deleted_at < deleted_before).order_by(Post.deleted_at)\
+        .limit(batch_size).with_for_update(skip_locked=True)
+    return connection.execute(delete(Post.__table__).where(Post.id.in_(post_ids))).rowcount
+
+
+def purge(after: int = PURGE_AFTER, batch_size: int = PURGE_BATCH_SIZE, pause: float = PURGE_PAUSE):
+    """ Количество удалённых строк; каждая пачка - отдельная транзакция"""
+    deleted_before = datetime.now() - timedelta(seconds=after)
+    total = 0
+    while True:
+        with engine.begin() as connection:
+            purged = purge_batch(connection, deleted_before, batch_size)
+        total += purged
+        if purged < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='purge soft-deleted posts')
+    parser.add_argument('--after', type=int, default=PURGE_AFTER, help='seconds since deletion')
+    parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=PURGE_PAUSE, help='seconds between batches')
+    parser.add_argument('--loop', action='store_true', help=f'repeat every PURGE_INTERVAL ({PURGE_INTERVAL} s)')
+    args = parser.parse_args()
+    while True:
+        print(f'purged posts: {purge(args.after, args.batch_size, args.pause)}')
+        if not args.loop:
+            break
+        time.sleep(PURGE_INTERVAL)
+
+
+if __name__ == '__main__':
+    main()
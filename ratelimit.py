@@ -0,0 +1,108 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from flask import request
+from errors import ApiException
+from auth import get_client_key
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# 'default=100/s,posts_bulk=5/m,auth_token=10/m' - лимиты по endpoint Flask; пусто - без ограничений
+RATE_LIMITS = os.getenv('RATE_LIMITS', '')
+RATE_LIMIT_URL = os.getenv('RATE_LIMIT_URL')
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+def parse_limit(limit: str):
+    """ 'N/s' -> (пополнение токенов в секунду, размер корзины N)"""
+    count, period = limit.strip().split('/')
+    return int(count) / PERIODS[period], int(count)
+
+
+def parse_limits(limits: str):
+    result = {}
+    for item in filter(None, (item.strip() for item in limits.split(','))):
+        endpoint, limit = item.split('=')
+        result[endpoint.strip()] = parse_limit(limit)
+    return result
+
+
+class MemoryBackend:
+    """ Корзины в памяти процесса (у каждого воркера свои)"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int):
+        """ (разрешено, через сколько секунд появится токен)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class RedisBackend:
+    """ Общие для всех воркеров корзины (redis или совместимый сервер)"""
+
+    SCRIPT = '''
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or ARGV[2])
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or ARGV[3])
+tokens = math.min(tonumber(ARGV[2]), tokens + (tonumber(ARGV[3]) - updated) * tonumber(ARGV[1]))
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', ARGV[3])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2]) / tonumber(ARGV[1])) + 1)
+return {allowed, tostring(tokens)}
+'''
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError('RATE_LIMIT_URL is set, but redis package is not installed')
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key: str, rate: float, burst: int):
+        allowed, tokens = self._script(keys=[f'ratelimit:{key}'], args=[rate, burst, time.time()])
+        return bool(allowed), 0 if allowed else (1 - float(tokens)) / rate
+
+
+class RateLimiter:
+    def __init__(self, limits: dict, backend):
+        self.limits = limits
+        self.backend = backend
+
+    def check(self):
+        limit = self.limits.get(request.endpoint) or self.limits.get('default')
+        if limit is None:
+            return
+        client_key = get_client_key(request.headers.get('Authorization'), request.remote_addr)
+        allowed, retry_after = self.backend.take(f'{request.endpoint}:{client_key}', *limit)
+        if not allowed:
+            raise ApiException(429, 'too many requests', {'Retry-After': str(math.ceil(retry_after))})
+
+
+def init_app(app, limits: str = RATE_LIMITS):
+    backend = RedisBackend(RATE_LIMIT_URL) if RATE_LIMIT_URL else MemoryBackend(RATE_LIMIT_MAX_KEYS)
+    limiter = RateLimiter(parse_limits(limits), backend)
+    if limiter.limits:
+        app.before_request(limiter.check)
+    return limiter
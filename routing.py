@@ -0,0 +1,53 @@
+"""Чтение с реплик (DB_REPLICA_URLS в db.py) с учётом собственных изменений клиента
+
+GET-запросы списков, поиска и выборки полей идут на реплики (read_session), но клиент,
+который недавно что-то изменил (успешный POST/PUT/PATCH/DELETE), ещё READ_YOUR_WRITES_SECONDS
+читает из основной базы и видит свои изменения, даже если реплика отстаёт.
+Отметка 'читать из основной базы до <время>' подписывается TOKEN_SECRET и уходит клиенту в cookie
+и заголовке ответа - её примет любой процесс и сервер приложения, независимо от способа аутентификации.
+"""
+import os
+import hmac
+import math
+import time
+from flask import request
+from auth import sign_token_payload
+from db import replica_pool, read_session
+
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+READ_PRIMARY_COOKIE = 'read_primary_until'
+READ_PRIMARY_HEADER = 'X-Read-Primary-Until'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def create_read_primary_marker(seconds: float = READ_YOUR_WRITES_SECONDS):
+    """ Отметка вида '<unix-время окончания>.<подпись>'"""
+    payload = f'{time.time() + seconds:.3f}'
+    return f'{payload}.{sign_token_payload(payload)}'
+
+
+def check_read_primary_marker(marker):
+    """ Отметка подписана и ещё не истекла"""
+    payload, _, signature = (marker or '').rpartition('.')
+    if not payload or not hmac.compare_digest(signature.encode(), sign_token_payload(payload).encode()):
+        return False
+    return float(payload) > time.time()
+
+
+def get_read_session():
+    """ Сессия для чтения в текущем запросе"""
+    if not replica_pool.engines:
+        return read_session(primary=True)
+    marker = request.headers.get(READ_PRIMARY_HEADER) or request.cookies.get(READ_PRIMARY_COOKIE)
+    return read_session(primary=check_read_primary_marker(marker))
+
+
+def init_app(app):
+    @app.after_request
+    def mark_writer(response):
+        if replica_pool.engines and request.method in WRITE_METHODS and response.status_code < 400:
+            marker = create_read_primary_marker()
+            response.headers[READ_PRIMARY_HEADER] = marker
+            response.set_cookie(READ_PRIMARY_COOKIE, marker, max_age=math.ceil(READ_YOUR_WRITES_SECONDS),
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,78 @@
+import re
+import threading
+from collections import defaultdict
+from sqlalchemy import func, literal_column, tuple_, cast, Float
+from db import Post, SEARCH_CONFIG
+from pagination import decode_rank_cursor
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str):
+    return TOKEN_RE.findall(text.lower())
+
+
+class InvertedIndex:
+    """ Поиск без PostgreSQL (тесты, разработка): индекс в памяти процесса,
+    перестраивается при первом поиске после изменения объявлений"""
+
+    def __init__(self):
+        self._postings = None
+        self._generation = 0  # растёт при каждом invalidate
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._postings = None
+
+    def build(self, session):
+        postings = defaultdict(lambda: defaultdict(int))
+        posts_query = session.query(Post.id, Post.title, Post.content).filter(Post.deleted_at.is_(None)).yield_per(1000)
+        for post_id, title, content in posts_query:
+            for token in tokenize(f'{title} {content}'):
+                postings[token][post_id] += 1
+        return postings
+
+    def search(self, session, q: str):
+        """ [(rank, post_id)] для объявлений, содержащих все слова запроса"""
+        with self._lock:
+            postings, generation = self._postings, self._generation
+        if postings is None:
+            postings = self.build(session)
+            # индекс, построенный до изменения, которое пришло во время построения, не сохраняем
+            with self._lock:
+                if self._generation == generation:
+                    self._postings = postings
+        tokens = set(tokenize(q))
+        if not tokens:
+            return []
+        matches = [postings.get(token, {}) for token in tokens]
+        post_ids = set.intersection(*(set(match) for match in matches))
+        return [(float(sum(match[post_id] for match in matches)), post_id) for post_id in post_ids]
+
+
+search_index = InvertedIndex()
+
+
+def search_posts(session, q: str, limit: int, cursor: str | None, columns: list):
+    """ Найденные объявления по убыванию релевантности: [(rank, строка с columns)], не больше limit + 1.
+    columns должны включать Post.id"""
+    if session.bind.dialect.name == 'postgresql':
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        # ts_rank - real: в курсоре ранг хранится как float8, и без приведения граничная строка
+        # при сравнении снова попадала бы на следующую страницу
+        rank = cast(func.ts_rank(literal_column('post_table.search_vector'), query), Float)
+        posts_query = session.query(rank.label('rank'), *columns)\
+            .filter(literal_column('post_table.search_vector').op('@@')(query), Post.deleted_at.is_(None))
+        if cursor:
+            posts_query = posts_query.filter(tuple_(rank, Post.id) < tuple_(*decode_rank_cursor(cursor)))
+        return [(row.rank, row) for row in posts_query.order_by(rank.desc(), Post.id.desc()).limit(limit + 1)]
+
+    found = sorted(search_index.search(session, q), reverse=True)
+    if cursor:
+        last = decode_rank_cursor(cursor)
+        found = [item for item in found if item < last]
+    found = found[:limit + 1]
+    posts = {post.id: post for post in session.query(*columns).filter(Post.id.in_([post_id for _, post_id in found]))}
+    return [(rank, posts[post_id]) for rank, post_id in found if post_id in posts]
@@ -0,0 +1,32 @@
+from operator import attrgetter
+from db import Post
+from errors import ApiException
+
+POST_FIELDS = ('id', 'title', 'content', 'created', 'user_id', 'version')
+
+
+def get_post_fields(fields_from_args):
+    """ Поля объявления из query-параметра fields (через запятую)"""
+    if not fields_from_args:
+        return POST_FIELDS
+    fields = set(fields_from_args.split(','))
+    unknown = fields.difference(POST_FIELDS)
+    if unknown:
+        raise ApiException(400, f'unknown fields: {", ".join(sorted(unknown))}')
+    return tuple(field for field in POST_FIELDS if field in fields)
+
+
+def post_columns(fields, *extra_fields):
+    """ Колонки для select только нужных полей (extra_fields - например, для курсора)"""
+    return [getattr(Post, field) for field in dict.fromkeys(fields + extra_fields)]
+
+
+def post_serializer(fields=POST_FIELDS):
+    """ Функция, превращающая объект Post или строку select в dict с полями fields"""
+    getter = attrgetter(*fields)
+    if len(fields) == 1:
+        return lambda row: {fields[0]: getter(row)}
+    return lambda row: dict(zip(fields, getter(row)))
+
+
+serialize_post = post_serializer()
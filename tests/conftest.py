@@ -1,4 +1,8 @@
+import os
 from random import randint
+
+os.environ.setdefault('TOKEN_SECRET', 'test-token-secret')  # до импорта auth: без ключа он не загружается
+
 from db import Base, Session, Post, User
 from pytest import fixture
 from datetime import datetime
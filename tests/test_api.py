@@ -1,4 +1,11 @@
 import requests
+import threading
+from datetime import datetime
+from sqlalchemy import text, func
+from db import Session, Post, User, PostChange
+from counters import reconcile
+from purge import purge
+from views import filter_posts, update_posts
 from tests.config import API_URL
 
 
@@ -241,3 +248,406 @@ def test_delete_post():
     resp = requests.delete(f'{API_URL}/posts/3', auth=('Ali', 'p123'))
     assert resp.status_code == 200
     assert resp.json() == {'status': 'post deleted'}
+
+
+def test_get_posts_with_cursor():
+    resp = requests.get(f'{API_URL}/posts/', params={'limit': 1})
+    assert resp.status_code == 200
+    first_page = resp.json()
+    assert len(first_page) == 1
+    assert 'X-Next-Cursor' in resp.headers
+    resp = requests.get(f'{API_URL}/posts/', params={'limit': 1, 'cursor': resp.headers['X-Next-Cursor']})
+    assert resp.status_code == 200
+    assert resp.json()[0]['id'] != first_page[0]['id']
+
+
+def test_get_posts_invalid_cursor():
+    resp = requests.get(f'{API_URL}/posts/', params={'cursor': 'wrong'})
+    assert resp.status_code == 400
+    assert resp.json()['message'] == 'invalid cursor'
+
+
+def test_get_posts_stream():
+    resp = requests.get(f'{API_URL}/posts/', params={'stream': 'ndjson'})
+    assert resp.status_code == 200
+    assert resp.headers['Content-Type'] == 'application/x-ndjson'
+    assert len(resp.text.splitlines()) == len(requests.get(f'{API_URL}/posts/').json())
+
+
+def test_cached_credentials_do_not_accept_wrong_password():
+    for _ in range(2):
+        resp = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'Кэш',
+                                                                              'content': 'Повторный запрос',
+                                                                              'user_id': 3})
+        assert resp.status_code == 200
+    resp = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p1234'), json={'title': 'Кэш',
+                                                                           'content': 'Неверный пароль',
+                                                                           'user_id': 3})
+    assert resp.status_code == 403
+    assert resp.json()['message'] == 'wrong username or password'
+
+
+def test_create_post_with_token():
+    resp = requests.post(f'{API_URL}/auth/token', auth=('Ali', 'p123'))
+    assert resp.status_code == 200
+    token = resp.json()['token']
+    resp = requests.post(f'{API_URL}/posts/', headers={'Authorization': f'Bearer {token}'},
+                         json={'title': 'Токен', 'content': 'Пост по токену', 'user_id': 3})
+    assert resp.status_code == 200
+    assert resp.json()['title'] == 'Токен'
+
+
+def test_create_post_with_wrong_token():
+    resp = requests.post(f'{API_URL}/posts/', headers={'Authorization': 'Bearer 3.9999999999.wrong'},
+                         json={'title': 'Токен', 'content': 'Поддельный токен', 'user_id': 3})
+    assert resp.status_code == 403
+    assert resp.json()['message'] == 'invalid token'
+
+
+def test_create_post_with_non_ascii_token():
+    resp = requests.post(f'{API_URL}/posts/', headers={'Authorization': 'Bearer \xff.\xff'},
+                         json={'title': 'Токен', 'content': 'Не ASCII', 'user_id': 3})
+    assert resp.status_code == 403
+    assert resp.json()['message'] == 'invalid token'
+
+
+def test_pool_stats():
+    resp = requests.get(f'{API_URL}/pool-stats')
+    assert resp.status_code == 200
+    json_data = resp.json()
+    assert json_data['checkouts'] > 0
+    assert 'checked_out' in json_data
+
+
+def test_get_post_not_modified():
+    new_post = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'ETag',
+                                                                              'content': 'Кэш',
+                                                                              'user_id': 3}).json()
+    resp = requests.get(f'{API_URL}/posts/{new_post["id"]}')
+    assert resp.status_code == 200
+    etag = resp.headers['ETag']
+    resp = requests.get(f'{API_URL}/posts/{new_post["id"]}', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+
+
+def test_get_post_after_update():
+    new_post = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'Old',
+                                                                              'content': 'Кэш',
+                                                                              'user_id': 3}).json()
+    assert requests.get(f'{API_URL}/posts/{new_post["id"]}').json()['title'] == 'Old'
+    requests.patch(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'), json={'title': 'New'})
+    assert requests.get(f'{API_URL}/posts/{new_post["id"]}').json()['title'] == 'New'
+
+
+def test_bulk_create_posts():
+    resp = requests.post(f'{API_URL}/posts/bulk', auth=('Ali', 'p123'), json=[
+        {'title': 'Первый', 'content': 'Пачка', 'user_id': 3},
+        {'title': 'Чужой', 'content': 'Пачка', 'user_id': 1},
+        {'title': 'Без владельца', 'content': 'Пачка'},
+    ])
+    assert resp.status_code == 200
+    json_data = resp.json()
+    assert json_data[0]['status'] == 'created'
+    assert requests.get(f'{API_URL}/posts/{json_data[0]["id"]}').json()['title'] == 'Первый'
+    assert json_data[1]['message'] == 'you are not allowed to set non-your user_id'
+    assert json_data[2]['status'] == 'error'
+
+
+def test_bulk_create_posts_ndjson():
+    body = '{"title": "A", "content": "ndjson", "user_id": 3}\n{"title": "B", "content": "ndjson", "user_id": 3}\n'
+    resp = requests.post(f'{API_URL}/posts/bulk', auth=('Ali', 'p123'), data=body.encode(),
+                         headers={'Content-Type': 'application/x-ndjson'})
+    assert resp.status_code == 200
+    assert [item['status'] for item in resp.json()] == ['created', 'created']
+
+
+def test_bulk_update_and_delete_posts():
+    created = requests.post(f'{API_URL}/posts/bulk', auth=('Ali', 'p123'), json=[
+        {'title': 'Один', 'content': 'Пачка', 'user_id': 3},
+        {'title': 'Два', 'content': 'Пачка', 'user_id': 3},
+    ]).json()
+    post_ids = [item['id'] for item in created]
+    resp = requests.patch(f'{API_URL}/posts/bulk', auth=('Ali', 'p123'), json=[
+        {'id': post_ids[0], 'title': 'Изменён'},
+        {'id': 2, 'title': 'Чужой'},
+        {'id': 8888, 'title': 'Нет такого'},
+    ])
+    assert [item['status'] for item in resp.json()] == ['updated', 'error', 'error']
+    assert requests.get(f'{API_URL}/posts/{post_ids[0]}').json()['title'] == 'Изменён'
+    resp = requests.delete(f'{API_URL}/posts/bulk', auth=('Ali', 'p123'), json=post_ids + [2])
+    assert [item['status'] for item in resp.json()] == ['deleted', 'deleted', 'error']
+    assert requests.get(f'{API_URL}/posts/{post_ids[1]}').status_code == 404
+
+
+def test_search_posts():
+    requests.post(f'{API_URL}/posts/bulk', auth=('Ali', 'p123'), json=[
+        {'title': 'Продам велосипед', 'content': 'Почти новый велосипед', 'user_id': 3},
+        {'title': 'Куплю велосипед', 'content': 'Недорого', 'user_id': 3},
+        {'title': 'Продам шкаф', 'content': 'Дубовый', 'user_id': 3},
+    ])
+    resp = requests.get(f'{API_URL}/posts/search', params={'q': 'велосипед'})
+    assert resp.status_code == 200
+    json_data = resp.json()
+    assert [post['title'] for post in json_data] == ['Продам велосипед', 'Куплю велосипед']
+    resp = requests.get(f'{API_URL}/posts/search', params={'q': 'велосипед', 'limit': 1})
+    assert len(resp.json()) == 1
+    resp = requests.get(f'{API_URL}/posts/search', params={'q': 'велосипед', 'limit': 1,
+                                                           'cursor': resp.headers['X-Next-Cursor']})
+    assert [post['title'] for post in resp.json()] == ['Куплю велосипед']
+
+
+def test_search_posts_pages_do_not_repeat():
+    created = requests.post(f'{API_URL}/posts/bulk', auth=('Ali', 'p123'), json=[
+        {'title': 'Зонт', 'content': ' '.join(['зонт'] * count), 'user_id': 3} for count in range(1, 6)
+    ] * 2).json()
+    found, cursor = [], None
+    for _ in range(10):  # повторяющаяся граничная строка зациклила бы листание
+        params = {'q': 'зонт', 'limit': 2, **({'cursor': cursor} if cursor else {})}
+        resp = requests.get(f'{API_URL}/posts/search', params=params)
+        found += [post['id'] for post in resp.json()]
+        cursor = resp.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert sorted(found) == sorted(post['id'] for post in created)
+
+
+def test_search_posts_without_query():
+    resp = requests.get(f'{API_URL}/posts/search')
+    assert resp.status_code == 400
+    assert resp.json()['message'] == 'search query q is required'
+
+
+def test_get_posts_filtered_by_user():
+    resp = requests.get(f'{API_URL}/posts/', params={'user_id': 3, 'order': 'desc'})
+    assert resp.status_code == 200
+    json_data = resp.json()
+    assert json_data and all(post['user_id'] == 3 for post in json_data)
+    assert [post['id'] for post in json_data] == sorted((post['id'] for post in json_data), reverse=True)
+    assert requests.get(f'{API_URL}/users/3/posts', params={'order': 'desc'}).json() == json_data
+
+
+def test_get_posts_created_before():
+    resp = requests.get(f'{API_URL}/posts/', params={'created_before': '2000-01-01T00:00:00'})
+    assert resp.status_code == 200
+    assert resp.json() == []
+    resp = requests.get(f'{API_URL}/posts/', params={'created_before': 'yesterday'})
+    assert resp.status_code == 400
+    assert resp.json()['message'] == 'invalid created_before'
+
+
+def explain(posts_query):
+    with Session() as session:
+        session.execute(text('SET enable_seqscan = off'))
+        compiled = posts_query.statement.compile(session.bind)
+        plan = session.connection().exec_driver_sql(f'EXPLAIN {compiled}', compiled.params)
+        return '\n'.join(row[0] for row in plan)
+
+
+def test_posts_by_user_use_index():
+    plan = explain(filter_posts(Session().query(Post), {'order': 'desc'}, user_id=3).limit(100))
+    assert 'Index Scan' in plan
+    assert 'ix_post_user_created' in plan
+
+
+def test_posts_by_created_use_index():
+    plan = explain(filter_posts(Session().query(Post), {'created_after': '2020-01-01T00:00:00'}).limit(100))
+    assert 'Index Scan' in plan
+    assert 'ix_post_created' in plan
+
+
+def test_get_posts_with_fields():
+    resp = requests.get(f'{API_URL}/posts/', params={'fields': 'id,title', 'limit': 1})
+    assert resp.status_code == 200
+    json_data = resp.json()
+    assert set(json_data[0]) == {'id', 'title'}
+    assert 'X-Next-Cursor' in resp.headers
+    resp = requests.get(f'{API_URL}/posts/{json_data[0]["id"]}', params={'fields': 'title'})
+    assert resp.json() == {'title': json_data[0]['title']}
+
+
+def test_get_posts_with_unknown_fields():
+    resp = requests.get(f'{API_URL}/posts/', params={'fields': 'title,password'})
+    assert resp.status_code == 400
+    assert resp.json()['message'] == 'unknown fields: password'
+
+
+def test_metrics():
+    requests.get(f'{API_URL}/posts/1')
+    resp = requests.get(f'{API_URL}/metrics')
+    assert resp.status_code == 200
+    assert resp.headers['Content-Type'].startswith('text/plain')
+    assert 'http_request_duration_seconds_count{method="GET",route="/posts/<int:post_id>",status="200"}' in resp.text
+    assert 'http_request_sql_statements_bucket' in resp.text
+    assert 'password_hash_duration_seconds_count{operation="check"}' in resp.text
+    assert 'validation_duration_seconds_count{model="PostCreateValidate"}' in resp.text
+    assert '# TYPE credential_cache_hits_total counter' in resp.text
+
+
+def test_created_in_iso_format():
+    new_post = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'ISO',
+                                                                              'content': 'Дата',
+                                                                              'user_id': 3}).json()
+    created = datetime.fromisoformat(new_post['created'])
+    assert requests.get(f'{API_URL}/posts/{new_post["id"]}').json()['created'] == created.isoformat()
+
+
+def test_update_post_if_match():
+    new_post = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'Версия',
+                                                                              'content': 'If-Match',
+                                                                              'user_id': 3}).json()
+    etag = requests.get(f'{API_URL}/posts/{new_post["id"]}').headers['ETag']
+    resp = requests.patch(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'), json={'title': 'Первая правка'},
+                          headers={'If-Match': etag})
+    assert resp.status_code == 200
+    assert resp.json()['version'] == new_post['version'] + 1
+    resp = requests.patch(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'), json={'title': 'Вторая правка'},
+                          headers={'If-Match': etag})
+    assert resp.status_code == 412
+    assert resp.json()['message'] == 'post version does not match If-Match'
+    assert requests.get(f'{API_URL}/posts/{new_post["id"]}').json()['title'] == 'Первая правка'
+
+
+def test_update_post_readonly_field():
+    resp = requests.patch(f'{API_URL}/posts/1', auth=('Ali', 'p123'), json={'created': '2000-01-01T00:00:00'})
+    assert resp.status_code == 400
+    assert resp.json()['message'][0]['msg'] == 'extra fields not permitted'
+
+
+def test_user_post_count():
+    before = requests.get(f'{API_URL}/users/3').json()
+    new_post = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'Счётчик',
+                                                                              'content': 'Один',
+                                                                              'user_id': 3}).json()
+    user = requests.get(f'{API_URL}/users/3').json()
+    assert user['post_count'] == before['post_count'] + 1
+    assert user['last_post_at'] == new_post['created']
+    requests.delete(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'))
+    assert requests.get(f'{API_URL}/users/3').json()['post_count'] == before['post_count']
+
+
+def test_reconcile_post_counts(create_post):
+    assert reconcile() > 0
+    assert reconcile() == 0
+    with Session() as session:
+        assert session.query(User.post_count).filter(User.id == 1).scalar() == \
+               session.query(Post).filter(Post.user_id == 1).count()
+
+
+def last_change_seq():
+    with Session() as session:
+        return session.query(func.max(PostChange.seq)).scalar() or 0
+
+
+def test_post_changes():
+    since = last_change_seq()
+    new_post = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'Журнал',
+                                                                              'content': 'Событие',
+                                                                              'user_id': 3}).json()
+    requests.patch(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'), json={'title': 'Журнал 2'})
+    requests.delete(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'))
+    json_data = requests.get(f'{API_URL}/posts/changes', params={'since': since}).json()
+    assert [change['operation'] for change in json_data['changes']] == ['created', 'updated', 'deleted']
+    assert {change['post_id'] for change in json_data['changes']} == {new_post['id']}
+    assert json_data['changes'][1]['post']['title'] == 'Журнал 2'
+    assert json_data['changes'][2]['post'] is None
+    assert json_data['last_seq'] == json_data['changes'][-1]['seq']
+    assert requests.get(f'{API_URL}/posts/changes', params={'since': json_data['last_seq']}).json() == \
+           {'changes': [], 'last_seq': json_data['last_seq']}
+
+
+def test_post_changes_restored():
+    new_post = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'Вернётся',
+                                                                              'content': 'Событие',
+                                                                              'user_id': 3}).json()
+    requests.delete(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'))
+    since = last_change_seq()
+    requests.post(f'{API_URL}/posts/{new_post["id"]}/restore', auth=('Ali', 'p123'))
+    changes = requests.get(f'{API_URL}/posts/changes', params={'since': since}).json()['changes']
+    assert [change['operation'] for change in changes] == ['restored']
+    assert changes[0]['post'] == new_post
+
+
+def test_post_changes_long_poll():
+    since = last_change_seq()
+    create = threading.Timer(0.5, requests.post, [f'{API_URL}/posts/'],
+                             {'auth': ('Ali', 'p123'), 'json': {'title': 'Ждём', 'content': 'Long-poll', 'user_id': 3}})
+    create.start()
+    resp = requests.get(f'{API_URL}/posts/changes', params={'since': since, 'wait': 10})
+    create.join()
+    assert resp.elapsed.total_seconds() < 5
+    assert [change['post']['title'] for change in resp.json()['changes']] == ['Ждём']
+
+
+def test_post_changes_sse():
+    since = last_change_seq() - 1
+    with requests.get(f'{API_URL}/posts/changes', params={'since': since}, stream=True,
+                      headers={'Accept': 'text/event-stream'}) as resp:
+        assert resp.headers['Content-Type'].startswith('text/event-stream')
+        lines = resp.iter_lines(decode_unicode=True)
+        assert next(lines) == f'id: {since + 1}'
+        assert next(lines).startswith('event: ')
+        assert next(lines).startswith('data: {')
+
+
+def test_restore_deleted_post():
+    new_post = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'Корзина',
+                                                                              'content': 'Восстановить',
+                                                                              'user_id': 3}).json()
+    requests.delete(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'))
+    assert requests.get(f'{API_URL}/posts/{new_post["id"]}').status_code == 404
+    assert new_post['id'] not in [post['id'] for post in requests.get(f'{API_URL}/users/3/posts').json()]
+    assert requests.delete(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123')).status_code == 404
+    resp = requests.post(f'{API_URL}/posts/{new_post["id"]}/restore', auth=('Sam', 'psw123321'))
+    assert resp.json()['message'] == 'you do not have access rights to restore this post'
+    resp = requests.post(f'{API_URL}/posts/{new_post["id"]}/restore', auth=('Ali', 'p123'))
+    assert resp.status_code == 200
+    assert resp.json() == new_post
+    assert requests.get(f'{API_URL}/posts/{new_post["id"]}').json() == new_post
+    assert requests.post(f'{API_URL}/posts/{new_post["id"]}/restore', auth=('Ali', 'p123')).status_code == 404
+
+
+def test_purge_deleted_posts():
+    new_post = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'Корзина',
+                                                                              'content': 'Удалить',
+                                                                              'user_id': 3}).json()
+    requests.delete(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'))
+    assert purge(after=0, batch_size=1, pause=0) >= 1
+    with Session() as session:
+        assert session.query(Post).get(new_post['id']) is None
+    assert requests.post(f'{API_URL}/posts/{new_post["id"]}/restore', auth=('Ali', 'p123')).status_code == 404
+
+
+def test_update_post_if_match_checks_post_first():
+    resp = requests.patch(f'{API_URL}/posts/5555', auth=('Ali', 'p123'), json={'title': 'Нет'},
+                          headers={'If-Match': '"x"'})
+    assert resp.status_code == 404
+    resp = requests.patch(f'{API_URL}/posts/2', auth=('Ali', 'p123'), json={'title': 'Чужое'},
+                          headers={'If-Match': '"x"'})
+    assert resp.status_code == 403
+
+
+def test_empty_update_post():
+    new_post = requests.post(f'{API_URL}/posts/', auth=('Ali', 'p123'), json={'title': 'Пусто',
+                                                                              'content': 'Без изменений',
+                                                                              'user_id': 3}).json()
+    since = last_change_seq()
+    resp = requests.patch(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'), json={})
+    assert resp.status_code == 200
+    assert resp.json() == new_post
+    assert last_change_seq() == since
+    resp = requests.patch(f'{API_URL}/posts/{new_post["id"]}', auth=('Ali', 'p123'), json={},
+                          headers={'If-Match': '"v7"'})
+    assert resp.status_code == 412
+
+
+def test_update_posts_skips_deleted_and_foreign():
+    created = requests.post(f'{API_URL}/posts/bulk', auth=('Ali', 'p123'), json=[
+        {'title': 'Живое', 'content': 'Пачка', 'user_id': 3},
+        {'title': 'Удалённое', 'content': 'Пачка', 'user_id': 3},
+    ]).json()
+    post_ids = [item['id'] for item in created]
+    requests.delete(f'{API_URL}/posts/{post_ids[1]}', auth=('Ali', 'p123'))
+    with Session() as session:
+        rows = update_posts(session, 3, ('title',), {post_id: {'title': 'Новое'} for post_id in post_ids + [2]})
+        session.rollback()
+    assert [(row.id, row.title, row.version) for row in rows] == [(post_ids[0], 'Новое', 2)]
@@ -0,0 +1,79 @@
+from pytest import fixture
+from starlette.testclient import TestClient
+from asgi import app
+
+
+@fixture(scope='module')
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@fixture(scope='module')
+def async_user(client):
+    resp = client.post('/users/', json={'username': 'Async', 'email': 'async@loop.org', 'password': 'p321'})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+@fixture(scope='module')
+def other_user_post(client):
+    resp = client.post('/users/', json={'username': 'Other', 'email': 'other@loop.org', 'password': 'p654'})
+    assert resp.status_code == 200
+    resp = client.post('/posts/', auth=('Other', 'p654'),
+                       json={'title': 'Чужое', 'content': 'ASGI', 'user_id': resp.json()['id']})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_index(client):
+    resp = client.get('/index')
+    assert resp.status_code == 200
+    assert resp.json() == {'check': 'Ok'}
+
+
+def test_get_user(client, async_user):
+    resp = client.get(f'/users/{async_user["id"]}')
+    assert resp.status_code == 200
+    assert resp.json() == {'id': async_user['id'], 'username': 'Async', 'post_count': 0, 'last_post_at': None}
+
+
+def test_create_user_with_same_email(client, async_user):
+    resp = client.post('/users/', json={'username': 'Await', 'email': 'async@loop.org', 'password': 'p'})
+    assert resp.status_code == 400
+    assert resp.json()['message'] == 'field is not unique'
+
+
+def test_create_user_without_required_field(client):
+    resp = client.post('/users/', json={'username': 'Kongo', 'password': 'qwerty'})
+    assert resp.status_code == 400
+    assert resp.json() == {'message': [{'loc': ['email'], 'msg': 'field required', 'type': 'value_error.missing'}],
+                           'status': 'error'}
+
+
+def test_post_lifecycle(client, async_user):
+    auth = ('Async', 'p321')
+    resp = client.post('/posts/', auth=auth, json={'title': 'Async', 'content': 'ASGI', 'user_id': async_user['id']})
+    assert resp.status_code == 200
+    new_post = resp.json()
+    assert client.get(f'/posts/{new_post["id"]}').json() == new_post
+    assert client.get(f'/users/{async_user["id"]}/posts').json() == [new_post]
+    resp = client.patch(f'/posts/{new_post["id"]}', auth=auth, json={'title': 'Patch'})
+    assert resp.status_code == 200
+    assert resp.json()['title'] == 'Patch'
+    resp = client.delete(f'/posts/{new_post["id"]}', auth=auth)
+    assert resp.json() == {'status': 'post deleted'}
+    assert client.get(f'/posts/{new_post["id"]}').status_code == 404
+
+
+def test_create_post_wrong_password(client, async_user):
+    resp = client.post('/posts/', auth=('Async', 'wrong'),
+                       json={'title': 'Async', 'content': 'ASGI', 'user_id': async_user['id']})
+    assert resp.status_code == 403
+    assert resp.json()['message'] == 'wrong username or password'
+
+
+def test_update_post_wrong_user(client, async_user, other_user_post):
+    resp = client.patch(f'/posts/{other_user_post["id"]}', auth=('Async', 'p321'), json={'title': 'Patch'})
+    assert resp.status_code == 403
+    assert resp.json()['message'] == 'you do not have access rights to change this post'
@@ -0,0 +1,17 @@
+from benchmark import run_benchmark, run_validation_benchmark, SCENARIOS
+
+
+def test_run_benchmark_in_process():
+    report = run_benchmark(users=2, posts=20, requests_count=5, concurrency=2)
+    assert list(report['results']) == list(SCENARIOS)
+    for result in report['results'].values():
+        assert result['requests'] == 5
+        assert result['errors'] == 0
+        assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+
+
+def test_run_validation_benchmark():
+    results = run_validation_benchmark(number=100, batch_size=10)
+    assert list(results) == ['PostCreateValidate', 'UserCreateValidate']
+    for result in results.values():
+        assert all(value > 0 for value in result.values())
@@ -0,0 +1,56 @@
+import fakeredis
+import redis
+from flask import Flask
+from pytest import fixture
+import cache
+from cache import CacheEntry, LRUCache, RedisCache, cached_json_response
+
+
+@fixture(params=['memory', 'redis'])
+def backend(request, monkeypatch):
+    if request.param == 'memory':
+        return LRUCache(10, 60)
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url', lambda url: fakeredis.FakeRedis(server=server))
+    return RedisCache('redis://stand-in', 60)
+
+
+def test_get_set_delete(backend):
+    assert backend.get('post:1') is None
+    backend.set('post:1', CacheEntry(b'{"id": 1}', 'v1'), backend.generation('post:1'))
+    assert backend.get('post:1') == CacheEntry(b'{"id": 1}', 'v1')
+    backend.delete('post:1')
+    assert backend.get('post:1') is None
+    backend.set('post:1', CacheEntry(b'{"id": 1}', 'v2'), backend.generation('post:1'))
+    assert backend.get('post:1') == CacheEntry(b'{"id": 1}', 'v2')
+
+
+def test_set_after_delete_is_skipped(backend):
+    generation = backend.generation('post:1')
+    backend.delete('post:1')  # изменение закоммитили, пока заполнение читало старую строку
+    backend.set('post:1', CacheEntry(b'{"title": "old"}', 'v1'), generation)
+    assert backend.get('post:1') is None
+
+
+def test_generations_are_bounded():
+    backend = LRUCache(2, 60)
+    generation = backend.generation('post:1')
+    for post_id in range(1, 5):
+        backend.delete(f'post:{post_id}')
+    assert len(backend._generations) <= 2
+    backend.set('post:1', CacheEntry(b'{}', 'v1'), generation)
+    assert backend.get('post:1') is None
+
+
+def test_response_loaded_during_change_is_not_cached(backend, monkeypatch):
+    monkeypatch.setattr(cache, 'response_cache', backend)
+
+    def load():
+        backend.delete('post:1')
+        return {'title': 'old'}
+
+    with Flask('cache_test').test_request_context('/posts/1'):
+        response = cached_json_response('post:1', load)
+    assert response.json == {'title': 'old'}
+    assert 'Last-Modified' not in response.headers
+    assert backend.get('post:1') is None
@@ -0,0 +1,62 @@
+import time
+import auth
+from pytest import raises, fixture
+from werkzeug.security import generate_password_hash
+from db import Session, User
+from errors import ApiException
+from hashing import HashingService, submit_hash_password, submit_check_password, needs_rehash, hash_method_prefix, \
+    PASSWORD_HASH_METHOD
+
+
+def test_hash_and_check_password():
+    password_hash = submit_hash_password('p123').result()
+    assert password_hash.startswith(f'{PASSWORD_HASH_METHOD}$')
+    assert submit_check_password(password_hash, 'p123').result()
+    assert not submit_check_password(password_hash, 'p1234').result()
+
+
+def test_needs_rehash():
+    assert not needs_rehash(generate_password_hash('p', PASSWORD_HASH_METHOD))
+    assert needs_rehash(generate_password_hash('p', 'pbkdf2:sha256:1000'))
+
+
+def test_shorthand_hash_method_prefix():
+    for method in ('scrypt', 'scrypt:16384:8:1', 'pbkdf2', 'pbkdf2:sha256', 'pbkdf2:sha512:1000'):
+        assert hash_method_prefix(method) == generate_password_hash('p', method).split('$')[0]
+
+
+def test_saturated_service_returns_503():
+    service = HashingService(workers=1, queue_size=0)
+    with raises(ApiException) as error:
+        service.submit(generate_password_hash, 'p')
+    assert error.value.status_code == 503
+    assert error.value.headers == {'Retry-After': '1'}
+
+
+@fixture()
+def hashing_user():
+    """ Свой пользователь: тесты пересчитывают его хэш"""
+    username = f'Hasher{time.time_ns()}'
+    with Session() as session:
+        user = User(username=username, email=f'{username}@mail.org',
+                    password=generate_password_hash('p123', PASSWORD_HASH_METHOD))
+        session.add(user)
+        session.commit()
+        return {'id': user.id, 'username': username}
+
+
+def test_busy_rehash_does_not_fail_login(monkeypatch, hashing_user):
+    def busy(password):
+        raise ApiException(503, 'server is busy, retry later')
+
+    monkeypatch.setattr(auth, 'needs_rehash', lambda password_hash: True)
+    monkeypatch.setattr(auth, 'hash_password', busy)
+    assert auth.is_authenticated(hashing_user['username'], 'p123') == hashing_user['id']
+
+
+def test_rehash_invalidates_cached_credentials(monkeypatch, hashing_user):
+    cache_key = auth.credential_cache.make_key('Basic old')
+    auth.credential_cache.set(cache_key, hashing_user['id'])
+    monkeypatch.setattr(auth, 'needs_rehash', lambda password_hash: True)
+    assert auth.is_authenticated(hashing_user['username'], 'p123') == hashing_user['id']
+    assert auth.credential_cache.peek(cache_key) is None
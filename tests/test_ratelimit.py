@@ -0,0 +1,68 @@
+import fakeredis
+import redis
+from flask import Flask
+from pytest import approx
+from app import error_handler
+from auth import create_token
+from errors import ApiException
+from ratelimit import MemoryBackend, RedisBackend, init_app, parse_limit
+
+
+def make_app(limits: str):
+    app = Flask('ratelimit_test')
+    app.register_error_handler(ApiException, error_handler)
+    app.add_url_rule('/ping', 'ping', lambda: 'pong')
+    app.add_url_rule('/other', 'other', lambda: 'pong')
+    init_app(app, limits)
+    return app.test_client()
+
+
+def test_parse_limit():
+    assert parse_limit('5/s') == (5, 5)
+    assert parse_limit('30/m') == (approx(0.5), 30)
+
+
+def test_token_bucket():
+    backend = MemoryBackend(10)
+    assert backend.take('key', 1 / 60, 2) == (True, 0)
+    assert backend.take('key', 1 / 60, 2) == (True, 0)
+    allowed, retry_after = backend.take('key', 1 / 60, 2)
+    assert not allowed and 59 < retry_after <= 60
+    assert backend.take('another', 1 / 60, 2) == (True, 0)
+
+
+def test_redis_token_bucket(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url', lambda url: fakeredis.FakeRedis(server=server))
+    backend, other_worker = RedisBackend('redis://stand-in'), RedisBackend('redis://stand-in')
+    assert backend.take('key', 1 / 60, 2) == (True, 0)
+    assert other_worker.take('key', 1 / 60, 2) == (True, 0)
+    allowed, retry_after = backend.take('key', 1 / 60, 2)
+    assert not allowed and 59 < retry_after <= 60
+    assert other_worker.take('another', 1 / 60, 2) == (True, 0)
+    assert 0 < fakeredis.FakeRedis(server=server).ttl('ratelimit:key') <= 121  # корзина заполнится за 120 с
+
+
+def test_limit_returns_429():
+    client = make_app('ping=2/m')
+    assert [client.get('/ping').status_code for _ in range(3)] == [200, 200, 429]
+    response = client.get('/ping')
+    assert response.json['message'] == 'too many requests'
+    assert response.headers['Retry-After'] == '30'
+    assert client.get('/other').status_code == 200
+
+
+def test_limit_per_user():
+    client = make_app('default=1/m')
+    assert client.get('/ping').status_code == 200
+    assert client.get('/ping').status_code == 429
+    headers = {'Authorization': f'Bearer {create_token(1)}'}
+    assert client.get('/ping', headers=headers).status_code == 200
+    assert client.get('/ping', headers=headers).status_code == 429
+
+
+def test_limit_with_non_ascii_token():
+    client = make_app('default=1/m')
+    headers = {'Authorization': 'Bearer \xff.\xff'}
+    assert client.get('/ping', headers=headers).status_code == 200
+    assert client.get('/ping', headers=headers).status_code == 429
@@ -0,0 +1,21 @@
+from search import InvertedIndex
+
+
+class InvalidatedWhileBuilding(InvertedIndex):
+    def build(self, session):
+        postings = {'old': {1: 1}}
+        self.invalidate()  # изменение объявлений, закоммиченное во время построения
+        return postings
+
+
+def test_stale_index_is_not_kept():
+    index = InvalidatedWhileBuilding()
+    assert index.search(None, 'old') == [(1.0, 1)]
+    assert index._postings is None
+
+
+def test_index_is_kept_without_changes():
+    index = InvertedIndex()
+    index.build = lambda session: {'new': {2: 3}}
+    assert index.search(None, 'new') == [(3.0, 2)]
+    assert index._postings == {'new': {2: 3}}
@@ -0,0 +1,77 @@
+import base64
+from pytest import fixture
+from app import app
+from db import Session, engine, make_engine, Base
+
+
+def basic_auth(username: str, password: str):
+    return {'Authorization': 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()}
+
+
+@fixture(scope='module')
+def client(tmp_path_factory):
+    """ Приложение на SQLite (без RETURNING в SQLAlchemy 1.4) вместо PostgreSQL"""
+    sqlite_engine = make_engine(f'sqlite:///{tmp_path_factory.mktemp("sqlite") / "posts.db"}')
+    Base.metadata.create_all(sqlite_engine)
+    Session.configure(bind=sqlite_engine)
+    try:
+        yield app.test_client()
+    finally:
+        Session.configure(bind=engine)
+        sqlite_engine.dispose()
+
+
+@fixture(scope='module')
+def user(client):
+    user = client.post('/users/', json={'username': 'Lite', 'email': 'lite@sqlite.org', 'password': 'p789'}).json
+    return {'id': user['id'], 'auth': basic_auth('Lite', 'p789')}
+
+
+def create_post(client, user, title='SQLite'):
+    return client.post('/posts/', json={'title': title, 'content': 'Файл', 'user_id': user['id']},
+                       headers=user['auth']).json
+
+
+def test_update_post(client, user):
+    post = create_post(client, user)
+    resp = client.patch(f'/posts/{post["id"]}', json={'title': 'Изменено'},
+                        headers={**user['auth'], 'If-Match': f'"v{post["version"]}"'})
+    assert resp.status_code == 200
+    assert resp.json == {**post, 'title': 'Изменено', 'version': post['version'] + 1}
+    resp = client.patch(f'/posts/{post["id"]}', json={'title': 'Поздно'},
+                        headers={**user['auth'], 'If-Match': f'"v{post["version"]}"'})
+    assert resp.status_code == 412
+    assert client.get(f'/posts/{post["id"]}').json['title'] == 'Изменено'
+
+
+def test_bulk_create_posts(client, user):
+    items = [{'title': f'Пачка {number}', 'content': 'Файл', 'user_id': user['id']} for number in range(3)]
+    resp = client.post('/posts/bulk', json=items[:2] + [{'title': 'Без content'}] + items[2:], headers=user['auth'])
+    assert resp.status_code == 200
+    results = resp.json
+    assert [result['status'] for result in results] == ['created', 'created', 'error', 'created']
+    for result in results[:2] + results[3:]:
+        assert client.get(f'/posts/{result["id"]}').json['title'] == result['title']
+    assert [results[0]['title'], results[1]['title'], results[3]['title']] == ['Пачка 0', 'Пачка 1', 'Пачка 2']
+
+
+def test_delete_and_restore_post(client, user):
+    post = create_post(client, user)
+    assert client.delete(f'/posts/{post["id"]}', headers=user['auth']).status_code == 200
+    assert client.delete(f'/posts/{post["id"]}', headers=user['auth']).status_code == 404
+    resp = client.post(f'/posts/{post["id"]}/restore', headers=user['auth'])
+    assert resp.status_code == 200
+    assert resp.json == post
+    assert client.get(f'/posts/{post["id"]}').status_code == 200
+
+
+def test_bulk_update_and_delete_posts(client, user):
+    post_ids = [create_post(client, user, title)['id'] for title in ('Один', 'Два')]
+    client.delete(f'/posts/{post_ids[1]}', headers=user['auth'])
+    resp = client.patch('/posts/bulk', json=[{'id': post_ids[0], 'title': 'Изменён'},
+                                             {'id': post_ids[1], 'title': 'Удалён'}], headers=user['auth'])
+    assert [item['status'] for item in resp.json] == ['updated', 'error']
+    assert client.get(f'/posts/{post_ids[0]}').json['title'] == 'Изменён'
+    resp = client.delete('/posts/bulk', json=post_ids, headers=user['auth'])
+    assert [item['status'] for item in resp.json] == ['deleted', 'error']
+    assert client.get(f'/posts/{post_ids[0]}').status_code == 404
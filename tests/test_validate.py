@@ -0,0 +1,28 @@
+from pytest import raises
+from errors import ApiException
+from validate import validate, validate_many, PostCreateValidate, PostUpdateValidate, UserCreateValidate
+
+
+def test_validate_returns_values():
+    assert validate({'title': 'T', 'content': 'C', 'user_id': '3'}, PostCreateValidate) == \
+           {'title': 'T', 'content': 'C', 'user_id': 3}
+    assert validate({'title': 'T'}, PostUpdateValidate) == {'title': 'T', 'content': None, 'user_id': None}
+    assert validate({'title': 'T'}, PostUpdateValidate, exclude_unset=True) == {'title': 'T'}
+
+
+def test_validate_error_format():
+    with raises(ApiException) as error:
+        validate({'username': 'Kongo', 'password': 'qwerty'}, UserCreateValidate)
+    assert error.value.status_code == 400
+    assert error.value.message == [{'loc': ('email',), 'msg': 'field required', 'type': 'value_error.missing'}]
+    with raises(ApiException) as error:
+        validate({'title': None, 'version': 5}, PostUpdateValidate, exclude_unset=True)
+    assert [item['loc'] for item in error.value.message] == [('title',), ('version',)]
+
+
+def test_validate_many():
+    results = validate_many([{'title': 'T', 'content': 'C', 'user_id': 1}, {'title': 'T'}, 'post'],
+                            PostCreateValidate)
+    assert results[0] == ({'title': 'T', 'content': 'C', 'user_id': 1}, None)
+    assert [item['loc'] for item in results[1][1]] == [('content',), ('user_id',)]
+    assert results[2][1][0]['msg'] == 'PostCreateValidate expected dict not str'
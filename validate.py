@@ -1,6 +1,9 @@
+import time
 import pydantic
+from typing import Optional
 
 from errors import ApiException
+from metrics import validation_duration
 
 
 class UserCreateValidate(pydantic.BaseModel):
@@ -13,9 +16,49 @@ class PostCreateValidate(pydantic.BaseModel):
     content: str
     user_id: int
 
-def validate(data: dict, validate_class):
+class PostUpdateValidate(pydantic.BaseModel):
+    title: Optional[str]
+    content: Optional[str]
+    user_id: Optional[int]
+
+    class Config:
+        extra = pydantic.Extra.forbid
+
+    @pydantic.validator('title', 'content', 'user_id', pre=True)
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError('field may not be null')
+        return value
+
+def validate_values(data: dict, validate_class, exclude_unset: bool = False):
+    """ Проверенные значения полей сразу, без экземпляра модели и .dict() (поля моделей - не модели).
+    Ошибки - тот же pydantic.ValidationError"""
+    if not isinstance(data, dict):
+        return validate_class.parse_obj(data).dict(exclude_unset=exclude_unset)
+    values, fields_set, error = pydantic.validate_model(validate_class, data)
+    if error is not None:
+        raise error
+    if exclude_unset:
+        return {field: value for field, value in values.items() if field in fields_set}
+    return values
+
+def validate(data: dict, validate_class, exclude_unset: bool = False):
+    started = time.perf_counter()
     try:
-        return validate_class(**data).dict()
+        return validate_values(data, validate_class, exclude_unset)
     except pydantic.ValidationError as er:
         raise ApiException(400, er.errors())
+    finally:
+        validation_duration.observe(time.perf_counter() - started, validate_class.__name__)
 
+def validate_many(items: list, validate_class, exclude_unset: bool = False):
+    """ Проверка списка: для каждого элемента пара (данные, None) или (None, ошибки)"""
+    started = time.perf_counter()
+    results = []
+    for item in items:
+        try:
+            results.append((validate_values(item, validate_class, exclude_unset), None))
+        except pydantic.ValidationError as er:
+            results.append((None, er.errors()))
+    validation_duration.observe(time.perf_counter() - started, validate_class.__name__)
+    return results
@@ -1,37 +1,241 @@
+import os
+import json
+from datetime import datetime
 from flask.views import MethodView
 from db import User, Post, Session
-from flask import jsonify, request
+from flask import jsonify, request, stream_with_context, Response
+from sqlalchemy import tuple_, select, insert, update, values, column, func
+from werkzeug.http import parse_etags
 from errors import ApiException
 from sqlalchemy.exc import IntegrityError
-from validate import validate, UserCreateValidate, PostCreateValidate
-from auth import hash_password, total_check_authentication
+from validate import validate, validate_many, UserCreateValidate, PostCreateValidate, PostUpdateValidate
+from auth import hash_password, total_check_authentication, get_username_password_from_authdata, \
+    is_authenticated, create_token, TOKEN_TTL
+from pagination import get_limit, get_int, get_datetime, get_order, encode_cursor, decode_cursor, \
+    encode_rank_cursor, STREAM_BATCH_SIZE
+from cache import response_cache, cached_json_response
+from search import search_index, search_posts
+from json_provider import dumps_bytes
+from serializers import POST_FIELDS, get_post_fields, post_columns, post_serializer, serialize_post
+from counters import user_posts_added, user_posts_removed
+from routing import get_read_session
+from changes import post_change_row, record_post_changes, change_notifier, wait_for_changes, CHANGES_MAX_WAIT, \
+    CHANGES_KEEPALIVE
+
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 1000))
+
+
+def invalidate_posts(*post_ids: int):
+    """ Вызывается после commit любого изменения объявлений"""
+    for post_id in post_ids:
+        response_cache.delete(f'post:{post_id}')
+    search_index.invalidate()
+    change_notifier.notify()
+
+
+def invalidate_users(*user_ids: int):
+    """ Вызывается после commit изменения объявлений пользователя (post_count, last_post_at)"""
+    for user_id in user_ids:
+        response_cache.delete(f'user:{user_id}')
+
+
+def load_post(post_id: int, fields=POST_FIELDS, make_session=Session):
+    """ Для кэша - из основной базы: ответ с отстающей реплики остался бы в кэше до CACHE_TTL"""
+    with make_session() as session:
+        post = session.query(*post_columns(fields)).filter(Post.id == post_id, Post.deleted_at.is_(None)).first()
+        if post is None:
+            raise ApiException(404, 'post not found')
+        return post_serializer(fields)(post)
+
+
+def load_user(user_id: int):
+    """ Для кэша - из основной базы, как и load_post"""
+    with Session() as session:
+        user = session.query(User).get(user_id)
+        if user is None:
+            raise ApiException(404, 'user not found')
+        return {'id': user.id,
+                'username': user.username,
+                'post_count': user.post_count,
+                'last_post_at': user.last_post_at,
+                }
+
+
+def post_etag(post: dict):
+    return f'v{post["version"]}'
+
+
+def parse_if_match(if_match_from_headers):
+    """ Допустимые версии объявления из If-Match (ETag вида "v<version>"), None - без проверки.
+    Пустой список не совпадёт ни с одной версией: 412 вернётся после проверки объявления и владельца"""
+    if not if_match_from_headers:
+        return None
+    etags = parse_etags(if_match_from_headers)
+    if etags.star_tag:
+        return None
+    return [int(etag[1:]) for etag in etags.as_set() if etag[:1] == 'v' and etag[1:].isdigit()]
+
+
+def execute_returning(session, statement, columns):
+    """ UPDATE объявлений с RETURNING columns. Диалекты без RETURNING (SQLite в SQLAlchemy 1.4):
+    выбираем id подходящих строк, меняем только их и читаем заново в той же транзакции;
+    если строки успели измениться между SELECT и UPDATE - 409, транзакция откатывается"""
+    if session.get_bind().dialect.full_returning:
+        return session.execute(statement.returning(*columns)).all()
+    post_ids = session.execute(select(Post.id).where(statement.whereclause)).scalars().all()
+    if not post_ids:
+        return []
+    if session.execute(statement.where(Post.id.in_(post_ids))).rowcount != len(post_ids):
+        raise ApiException(409, 'post was changed concurrently, retry')
+    return session.query(*columns).filter(Post.id.in_(post_ids)).all()
+
+
+def insert_posts(session, rows: list, columns):
+    """ Вставка пачки объявлений, результат - строки columns в порядке rows.
+    Порядок строк RETURNING у многострочного INSERT PostgreSQL не гарантирует, поэтому id выделяются
+    заранее из последовательности и строки сопоставляются по id. Без RETURNING (SQLite) - INSERT на строку"""
+    if session.get_bind().dialect.full_returning:
+        post_ids = session.execute(select(func.nextval(func.pg_get_serial_sequence(Post.__tablename__, 'id')))
+                                   .select_from(func.generate_series(1, len(rows)))).scalars().all()
+        rows = [{**row, 'id': post_id} for row, post_id in zip(rows, post_ids)]
+        created = session.execute(insert(Post.__table__).values(rows).returning(*columns)).all()
+    else:
+        post_ids = [session.execute(insert(Post.__table__).values(row)).inserted_primary_key[0] for row in rows]
+        created = session.query(*columns).filter(Post.id.in_(post_ids)).all()
+    created = {row.id: row for row in created}
+    return [created[post_id] for post_id in post_ids]
+
+
+def post_update_statement(post_id: int, user_id: int, post_data: dict, versions=None):
+    """ Проверка владельца и версии и изменение - одним запросом (с RETURNING - см. execute_returning)"""
+    statement = update(Post.__table__).where(Post.id == post_id, Post.user_id == user_id, Post.deleted_at.is_(None))
+    if versions is not None:
+        statement = statement.where(Post.version.in_(versions))
+    return statement.values(version=Post.version + 1, **post_data)
+
+
+def update_posts(session, user_id: int, fields: tuple, post_data_by_id: dict):
+    """ Изменение пачки объявлений владельца с одинаковым набором полей: {post_id: post_data}.
+    Возвращает только действительно изменённые строки - удалённые и чужие объявления UPDATE пропускает.
+    PostgreSQL - один UPDATE ... FROM (VALUES ...) RETURNING, без RETURNING (SQLite) - UPDATE на объявление"""
+    columns = post_columns(POST_FIELDS)
+    if not session.get_bind().dialect.full_returning:
+        return [row for post_id, post_data in post_data_by_id.items()
+                for row in execute_returning(session, post_update_statement(post_id, user_id, post_data), columns)]
+    data = values(column('id', Post.id.type), *(column(field, Post.__table__.c[field].type) for field in fields),
+                  name='data').data([(post_id, *(post_data[field] for field in fields))
+                                     for post_id, post_data in post_data_by_id.items()])
+    statement = update(Post.__table__).where(Post.id == data.c.id, Post.user_id == user_id, Post.deleted_at.is_(None))\
+        .values(version=Post.version + 1, **{field: data.c[field] for field in fields})
+    return session.execute(statement.returning(*columns)).all()
+
+
+def post_update_error(post, user_id: int):
+    """ Почему UPDATE не нашёл строку; post - (user_id, version) объявления или None"""
+    if post is None:
+        return ApiException(404, 'post not found')
+    if post.user_id != user_id:
+        return ApiException(403, 'you do not have access rights to change this post')
+    return ApiException(412, 'post version does not match If-Match', {'ETag': f'"v{post.version}"'})
+
+
+def post_delete_statement(post_id: int, user_id: int):
+    """ Удаление объявления владельцем: только отметка deleted_at, строку удалит purge.py"""
+    return update(Post.__table__).where(Post.id == post_id, Post.user_id == user_id, Post.deleted_at.is_(None))\
+        .values(deleted_at=datetime.now())
+
+
+def post_restore_statement(post_id: int, user_id: int):
+    """ Восстановление удалённого объявления владельцем"""
+    return update(Post.__table__).where(Post.id == post_id, Post.user_id == user_id, Post.deleted_at.isnot(None))\
+        .values(deleted_at=None)
+
+
+def post_delete_error(post, user_id: int, action: str = 'delete'):
+    """ Почему удаление (или восстановление - action='restore') не нашло строку;
+    post - (user_id, deleted_at) объявления или None"""
+    if post is None or (post.deleted_at is None if action == 'restore' else post.deleted_at is not None):
+        return ApiException(404, 'post not found')
+    return ApiException(403, f'you do not have access rights to {action} this post')
+
+
+def filter_posts(posts_query, args, user_id=None):
+    """ Фильтры, сортировка и курсор списка объявлений из query-параметров.
+    Запросы покрываются индексами ix_post_created и ix_post_user_created"""
+    posts_query = posts_query.filter(Post.deleted_at.is_(None))
+    if user_id is None:
+        user_id = get_int(args.get('user_id'), 'user_id')
+    if user_id is not None:
+        posts_query = posts_query.filter(Post.user_id == user_id)
+    created_after = get_datetime(args.get('created_after'), 'created_after')
+    if created_after:
+        posts_query = posts_query.filter(Post.created > created_after)
+    created_before = get_datetime(args.get('created_before'), 'created_before')
+    if created_before:
+        posts_query = posts_query.filter(Post.created < created_before)
+    position = tuple_(Post.created, Post.id)
+    cursor = args.get('cursor')
+    if get_order(args.get('order')) == 'desc':
+        posts_query = posts_query.order_by(Post.created.desc(), Post.id.desc())
+        if cursor:
+            posts_query = posts_query.filter(position < tuple_(*decode_cursor(cursor)))
+    else:
+        posts_query = posts_query.order_by(Post.created, Post.id)
+        if cursor:
+            posts_query = posts_query.filter(position > tuple_(*decode_cursor(cursor)))
+    return posts_query
+
+
+def stream_posts(stream_format: str, args, fields, user_id=None):
+    """ Выгрузка всех объявлений потоком: ndjson или chunked json-массив"""
+    if stream_format not in ('ndjson', 'json'):
+        raise ApiException(400, 'stream must be ndjson or json')
+
+    serialize = post_serializer(fields)
+    session = get_read_session()
+
+    def generate():
+        with session:
+            posts_query = filter_posts(session.query(*post_columns(fields)), args, user_id)\
+                .execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
+            if stream_format == 'json':
+                yield b'['
+            for number, p in enumerate(posts_query):
+                post = dumps_bytes(serialize(p))
+                if stream_format == 'ndjson':
+                    yield post + b'\n'
+                else:
+                    yield post if number == 0 else b',' + post
+            if stream_format == 'json':
+                yield b']'
+
+    mimetype = 'application/x-ndjson' if stream_format == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
 
 
 class PostView(MethodView):
-    def get(self, post_id=None):
+    def get(self, post_id=None, user_id=None):
+        fields = get_post_fields(request.args.get('fields'))
         if post_id:
-            with Session() as session:
-                post = session.query(Post).get(post_id)
-                if post is None:
-                    raise ApiException(404, 'post not found')
-                return jsonify({'id': post.id,
-                                'title': post.title,
-                                'content': post.content,
-                                'created': post.created,
-                                'user_id': post.user_id
-                                })
+            if fields == POST_FIELDS:
+                return cached_json_response(f'post:{post_id}', lambda: load_post(post_id), post_etag)
+            return jsonify(load_post(post_id, fields, get_read_session))
         else:
-            with Session() as session:
-                posts_query = session.query(Post).all()
-                posts = []
-                for p in posts_query:
-                    post = {'id': p.id,
-                            'title': p.title,
-                            'content': p.content,
-                            'created': p.created,
-                            'user_id': p.user_id}
-                    posts.append(post)
-                return jsonify(posts)
+            stream_format = request.args.get('stream')
+            if stream_format:
+                return stream_posts(stream_format, request.args, fields, user_id)
+            limit = get_limit(request.args.get('limit'))
+            with get_read_session() as session:
+                # строки select без ORM-объектов; created и id нужны для курсора
+                posts_query = filter_posts(session.query(*post_columns(fields, 'created', 'id')), request.args,
+                                           user_id).limit(limit + 1).all()
+                serialize = post_serializer(fields)
+                posts = [serialize(p) for p in posts_query[:limit]]
+                response = jsonify(posts)
+                if len(posts_query) > limit:
+                    last_post = posts_query[limit - 1]
+                    response.headers['X-Next-Cursor'] = encode_cursor(last_post.created, last_post.id)
+                return response
 
     def post(self):
         post_data = validate(request.json, PostCreateValidate)
@@ -43,39 +247,44 @@ class PostView(MethodView):
                     raise ApiException(403, f'you are not allowed to set non-your user_id')
                 new_post = Post(**post_data)
                 session.add(new_post)
+                session.flush()
+                session.execute(user_posts_added(user_id, 1, new_post.created))
+                post = serialize_post(new_post)
+                record_post_changes(session, [post_change_row('created', post)])
                 session.commit()
-                return jsonify({'id': new_post.id,
-                                'title': new_post.title,
-                                'content': new_post.content,
-                                'created': new_post.created,
-                                'user_id': new_post.user_id})
+                invalidate_posts(new_post.id)
+                invalidate_users(user_id)
+                return jsonify(post)
         else:
             raise ApiException(401, 'authentication data has not been received')
 
     def patch(self, post_id: int):
-        post_data = request.json
         auth_from_headers = request.headers.get('Authorization')
         if auth_from_headers:
             user_id = total_check_authentication(auth_from_headers)
+            post_data = validate(request.json, PostUpdateValidate, exclude_unset=True)
+            if post_data.get('user_id', user_id) != user_id:
+                raise ApiException(403, f'you are not allowed to change the user_id')
+            versions = parse_if_match(request.headers.get('If-Match'))
             with Session() as session:
-                post = session.query(Post).get(post_id)
-                if post is None:
-                    raise ApiException(404, 'post not found')
-                elif user_id == post.user_id:
-                    for field, value in post_data.items():
-                        if field == 'user_id' and value != user_id:
-                            raise ApiException(403, f'you are not allowed to change the user_id')
-                        setattr(post, field, value)
-                    session.add(post)
-                    session.commit()
-                    return jsonify({'id': post.id,
-                                    'title': post.title,
-                                    'content': post.content,
-                                    'created': post.created,
-                                    'user_id': post.user_id
-                                    })
+                statement = post_update_statement(post_id, user_id, post_data, versions)
+                if post_data:
+                    posts = execute_returning(session, statement, post_columns(POST_FIELDS))
                 else:
-                    raise ApiException(403, 'you do not have access rights to change this post')
+                    # пустой PATCH: те же проверки, но без записи, новой версии и события в журнале
+                    posts = session.query(*post_columns(POST_FIELDS)).filter(statement.whereclause).all()
+                if not posts:
+                    raise post_update_error(session.query(Post.user_id, Post.version)
+                                            .filter(Post.id == post_id, Post.deleted_at.is_(None)).first(), user_id)
+                post = serialize_post(posts[0])
+                if post_data:
+                    record_post_changes(session, [post_change_row('updated', post)])
+                    session.commit()
+            if post_data:
+                invalidate_posts(post_id)
+            response = jsonify(post)
+            response.set_etag(post_etag(post))
+            return response
         else:
             raise ApiException(401, 'authentication data has not been received')
 
@@ -84,28 +293,246 @@ class PostView(MethodView):
         if auth_from_headers:
             user_id = total_check_authentication(auth_from_headers)
             with Session() as session:
-                post = session.query(Post).get(post_id)
-                if post is None:
-                    raise ApiException(404, 'post not found')
-                elif user_id == post.user_id:
-                    session.delete(post)
-                    session.commit()
-                    return jsonify({'status': 'post deleted'})
-                else:
-                    raise ApiException(403, 'you do not have access rights to delete this post')
+                if not execute_returning(session, post_delete_statement(post_id, user_id), [Post.id]):
+                    raise post_delete_error(
+                        session.query(Post.user_id, Post.deleted_at).filter(Post.id == post_id).first(), user_id)
+                session.execute(user_posts_removed(user_id, 1))
+                record_post_changes(session, [post_change_row('deleted', {'id': post_id, 'user_id': user_id})])
+                session.commit()
+            invalidate_posts(post_id)
+            invalidate_users(user_id)
+            return jsonify({'status': 'post deleted'})
         else:
             raise ApiException(401, 'authentication data has not been received')
 
 
+def get_authenticated_user_id():
+    auth_from_headers = request.headers.get('Authorization')
+    if auth_from_headers:
+        return total_check_authentication(auth_from_headers)
+    else:
+        raise ApiException(401, 'authentication data has not been received')
+
+
+def get_bulk_items():
+    """ Элементы bulk-запроса: json-массив или ndjson (по объекту на строку)"""
+    if request.mimetype == 'application/x-ndjson':
+        try:
+            items = [json.loads(line) for line in request.stream if line.strip()]
+        except ValueError:
+            raise ApiException(400, 'invalid ndjson')
+    else:
+        items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise ApiException(400, 'list of items expected')
+    return items
+
+
+def get_post_owners(session, post_ids: list):
+    """ Владельцы объявлений одним IN-запросом на пачку: {post_id: user_id}"""
+    owners = {}
+    post_ids = list(set(post_ids))
+    for start in range(0, len(post_ids), BULK_CHUNK_SIZE):
+        chunk = post_ids[start:start + BULK_CHUNK_SIZE]
+        owners.update(session.query(Post.id, Post.user_id).filter(Post.id.in_(chunk), Post.deleted_at.is_(None)).all())
+    return owners
+
+
+def check_bulk_item_owner(owners: dict, post_id, user_id: int, action: str):
+    """ Ошибка для элемента bulk-запроса или None"""
+    if not isinstance(post_id, int):
+        return {'status': 'error', 'message': 'post id required'}
+    if post_id not in owners:
+        return {'id': post_id, 'status': 'error', 'message': 'post not found'}
+    if owners[post_id] != user_id:
+        return {'id': post_id, 'status': 'error', 'message': f'you do not have access rights to {action} this post'}
+    return None
+
+
+class PostBulkView(MethodView):
+    """ Массовые операции с объявлениями: одна аутентификация и одна транзакция на запрос.
+    Ответ - список результатов в порядке элементов запроса"""
+
+    def post(self):
+        user_id = get_authenticated_user_id()
+        items = get_bulk_items()
+        results = [None] * len(items)
+        positions, rows = [], []
+        for position, (post_data, errors) in enumerate(validate_many(items, PostCreateValidate)):
+            if errors is not None:
+                results[position] = {'status': 'error', 'message': errors}
+            elif post_data['user_id'] != user_id:
+                results[position] = {'status': 'error', 'message': 'you are not allowed to set non-your user_id'}
+            else:
+                positions.append(position)
+                rows.append(post_data)
+        posts = []
+        with Session() as session:
+            for start in range(0, len(rows), BULK_CHUNK_SIZE):
+                chunk = rows[start:start + BULK_CHUNK_SIZE]
+                created = insert_posts(session, chunk, post_columns(POST_FIELDS))
+                for position, row in zip(positions[start:], created):
+                    posts.append(serialize_post(row))
+                    results[position] = {'status': 'created', **posts[-1]}
+                session.execute(user_posts_added(user_id, len(created), max(row.created for row in created)))
+            record_post_changes(session, [post_change_row('created', post) for post in posts])
+            session.commit()
+        if posts:
+            invalidate_posts(*(post['id'] for post in posts))
+            invalidate_users(user_id)
+        return jsonify(results)
+
+    def patch(self):
+        user_id = get_authenticated_user_id()
+        items = get_bulk_items()
+        results = [None] * len(items)
+        post_ids = [item.pop('id', None) if isinstance(item, dict) else None for item in items]
+        validated = validate_many(items, PostUpdateValidate, exclude_unset=True)
+        updates, pending = {}, []
+        with Session() as session:
+            owners = get_post_owners(session, [post_id for post_id in post_ids if isinstance(post_id, int)])
+            for position, (post_id, (post_data, errors)) in enumerate(zip(post_ids, validated)):
+                error = check_bulk_item_owner(owners, post_id, user_id, 'change')
+                if error is None and errors is not None:
+                    error = {'id': post_id, 'status': 'error', 'message': errors}
+                if error is None and post_data.get('user_id', user_id) != user_id:
+                    error = {'id': post_id, 'status': 'error', 'message': 'you are not allowed to change the user_id'}
+                if error is not None:
+                    results[position] = error
+                    continue
+                if post_data:
+                    # повтор объявления с тем же набором полей: как при поочерёдном применении, побеждает последний
+                    updates.setdefault(tuple(sorted(post_data)), {})[post_id] = post_data
+                    pending.append((position, post_id))
+                else:
+                    results[position] = {'id': post_id, 'status': 'updated'}
+            # один UPDATE на каждый набор изменяемых полей и пачку объявлений
+            updated = {}
+            for fields, post_data_by_id in updates.items():
+                post_ids = list(post_data_by_id)
+                for start in range(0, len(post_ids), BULK_CHUNK_SIZE):
+                    chunk = {post_id: post_data_by_id[post_id] for post_id in post_ids[start:start + BULK_CHUNK_SIZE]}
+                    for row in update_posts(session, user_id, fields, chunk):
+                        updated[row.id] = serialize_post(row)
+            # результат - только по строкам, которые UPDATE действительно изменил
+            for position, post_id in pending:
+                results[position] = {'id': post_id, 'status': 'updated'} if post_id in updated else \
+                    {'id': post_id, 'status': 'error', 'message': 'post not found'}
+            record_post_changes(session, [post_change_row('updated', post) for post in updated.values()])
+            session.commit()
+        invalidate_posts(*updated)
+        return jsonify(results)
+
+    def delete(self):
+        user_id = get_authenticated_user_id()
+        items = get_bulk_items()
+        post_ids = [item.get('id') if isinstance(item, dict) else item for item in items]
+        results = []
+        deleted_ids = []
+        with Session() as session:
+            owners = get_post_owners(session, [post_id for post_id in post_ids if isinstance(post_id, int)])
+            for post_id in post_ids:
+                error = check_bulk_item_owner(owners, post_id, user_id, 'delete')
+                if error is None:
+                    deleted_ids.append(post_id)
+                    results.append({'id': post_id, 'status': 'deleted'})
+                else:
+                    results.append(error)
+            deleted_ids = list(set(deleted_ids))
+            deleted = []
+            for start in range(0, len(deleted_ids), BULK_CHUNK_SIZE):
+                chunk = deleted_ids[start:start + BULK_CHUNK_SIZE]
+                deleted += [row.id for row in execute_returning(
+                    session, update(Post.__table__).where(Post.id.in_(chunk), Post.user_id == user_id,
+                                                          Post.deleted_at.is_(None)).values(deleted_at=datetime.now()),
+                    [Post.id])]
+            if deleted:
+                session.execute(user_posts_removed(user_id, len(deleted)))
+            record_post_changes(session, [post_change_row('deleted', {'id': post_id, 'user_id': user_id})
+                                          for post_id in deleted])
+            session.commit()
+        invalidate_posts(*deleted_ids)
+        invalidate_users(user_id)
+        return jsonify(results)
+
+
+class PostRestoreView(MethodView):
+    """ Восстановление удалённого объявления, пока purge.py не удалил его окончательно"""
+
+    def post(self, post_id: int):
+        user_id = get_authenticated_user_id()
+        with Session() as session:
+            posts = execute_returning(session, post_restore_statement(post_id, user_id), post_columns(POST_FIELDS))
+            if not posts:
+                raise post_delete_error(session.query(Post.user_id, Post.deleted_at).filter(Post.id == post_id).first(),
+                                        user_id, 'restore')
+            session.execute(user_posts_added(user_id, 1, posts[0].created))
+            post = serialize_post(posts[0])
+            record_post_changes(session, [post_change_row('restored', post)])
+            session.commit()
+        invalidate_posts(post_id)
+        invalidate_users(user_id)
+        return jsonify(post)
+
+
+class PostSearchView(MethodView):
+    def get(self):
+        q = request.args.get('q', '').strip()
+        if not q:
+            raise ApiException(400, 'search query q is required')
+        limit = get_limit(request.args.get('limit'))
+        fields = get_post_fields(request.args.get('fields'))
+        with get_read_session() as session:
+            found = search_posts(session, q, limit, request.args.get('cursor'), post_columns(fields, 'id'))
+            serialize = post_serializer(fields)
+            posts = []
+            for rank, p in found[:limit]:
+                post = serialize(p)
+                post['rank'] = rank
+                posts.append(post)
+            response = jsonify(posts)
+            if len(found) > limit:
+                last_rank, last_post = found[limit - 1]
+                response.headers['X-Next-Cursor'] = encode_rank_cursor(last_rank, last_post.id)
+            return response
+
+
+def stream_changes(since: int, limit: int):
+    """ События журнала потоком Server-Sent Events (id события - seq)"""
+
+    def generate():
+        last_seq = since
+        while True:
+            changes = wait_for_changes(last_seq, limit, CHANGES_KEEPALIVE)
+            if not changes:
+                yield b': keepalive\n\n'
+                continue
+            for change in changes:
+                yield f'id: {change["seq"]}\nevent: {change["operation"]}\ndata: '.encode() + \
+                    dumps_bytes(change) + b'\n\n'
+            last_seq = changes[-1]['seq']
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+class PostChangesView(MethodView):
+    """ Журнал изменений объявлений после seq since (или заголовка Last-Event-ID)"""
+
+    def get(self):
+        since = get_int(request.args.get('since') or request.headers.get('Last-Event-ID'), 'since') or 0
+        limit = get_limit(request.args.get('limit'))
+        if request.args.get('stream') == 'sse' or request.accept_mimetypes.best == 'text/event-stream':
+            return stream_changes(since, limit)
+        wait = min(get_int(request.args.get('wait'), 'wait') or 0, CHANGES_MAX_WAIT)
+        changes = wait_for_changes(since, limit, wait)
+        return jsonify({'changes': changes,
+                        'last_seq': changes[-1]['seq'] if changes else since
+                        })
+
+
 class UserView(MethodView):
     def get(self, user_id: int):
-        with Session() as session:
-            user = session.query(User).get(user_id)
-            if user is None:
-                raise ApiException(404, 'user not found')
-            return jsonify({'id': user.id,
-                            'username': user.username,
-                            })
+        return cached_json_response(f'user:{user_id}', lambda: load_user(user_id))
 
     def post(self):
         user_data = validate(request.json, UserCreateValidate)
@@ -121,3 +548,17 @@ class UserView(MethodView):
                             'username': new_user.username,
                             'email': new_user.email
                             })
+
+
+class TokenView(MethodView):
+    def post(self):
+        auth_from_headers = request.headers.get('Authorization')
+        if auth_from_headers:
+            username, password = get_username_password_from_authdata(auth_from_headers)
+            user_id = is_authenticated(username, password)
+            return jsonify({'token': create_token(user_id),
+                            'token_type': 'Bearer',
+                            'expires_in': TOKEN_TTL
+                            })
+        else:
+            raise ApiException(401, 'authentication data has not been received')